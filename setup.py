@@ -48,6 +48,10 @@ setup(
     license='MIT',
     packages=find_packages(),
     install_requires=INSTALL_REQUIRES,
+    extras_require={
+        # optional packages that speed up catalog loading and serialization
+        'fast':['pyarrow', 'numexpr', 'orjson'],
+    },
     entry_points={
         'console_scripts':[
             'viz-mainserver=vizinspect.frontend.vizserver:main',
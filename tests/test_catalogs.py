@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+This compiles the statements built by `catalogs._get_objects_select` for all of
+the query shapes `get_objects` and `iter_objects` can ask for. This doesn't need
+a database; it only checks that SQLAlchemy can build valid Postgres SQL for each
+of them.
+
+'''
+
+import itertools
+
+import pytest
+
+pytest.importorskip('sqlalchemy')
+pytest.importorskip('pandas')
+
+from sqlalchemy.dialects import postgresql
+
+from vizinspect.backend import catalogs
+from vizinspect.backend.database import VIZINSPECT
+
+
+@pytest.mark.parametrize(
+    'getinfo, userid_mode, filter_review_status, sampled',
+    list(itertools.product(('objectids', 'all', 'count'),
+                           (None, 'include', 'exclude'),
+                           (False, True),
+                           (False, True)))
+)
+def test_get_objects_select_compiles(getinfo,
+                                     userid_mode,
+                                     filter_review_status,
+                                     sampled):
+    '''
+    Every getinfo mode should compile with every userid_check mode.
+
+    '''
+
+    for page_mode in itertools.product((False, True), repeat=3):
+
+        sel, revorder = catalogs._get_objects_select(
+            VIZINSPECT,
+            getinfo,
+            filter_review_status,
+            userid_mode,
+            page_mode,
+            sampled
+        )
+        sql = str(sel.compile(dialect=postgresql.dialect()))
+
+        if userid_mode is not None:
+            assert 'userid' in sql
+        if userid_mode == 'exclude' or (userid_mode == 'include' and
+                                        getinfo != 'all'):
+            assert 'EXISTS' in sql
+            assert 'user_comments' in sql
+
+
+def test_read_catalog_csv_pyarrow_matches_pandas(tmp_path, monkeypatch):
+    '''
+    The pyarrow and pandas CSV readers should give the same DataFrame.
+
+    '''
+
+    pytest.importorskip('pyarrow')
+    import pandas as pd
+
+    catalog_fpath = tmp_path / 'catalog.csv'
+    catalog_fpath.write_text(
+        'viz-id,ra,dec,name,flag,added\n'
+        '1,10.5,-1.25,abc,1,2019-08-01 12:00:00\n'
+        '2,11.0,,NA,0,2019-08-02 12:00:00\n'
+        '3,12.5,-2.5,,-99,2019-08-03 12:00:00\n'
+        '4,13.0,3.0,NaN,1,\n'
+    )
+
+    for pdkwargs in ({},
+                     {'usecols':['viz-id', 'ra', 'dec', 'name']},
+                     {'na_values':'-99'},
+                     {'dtype':{'ra':'float32'}}):
+
+        monkeypatch.setattr(catalogs, 'HAVE_PYARROW', True)
+        pyarrow_catalog = catalogs._read_catalog_csv(str(catalog_fpath),
+                                                     **dict(pdkwargs))
+
+        monkeypatch.setattr(catalogs, 'HAVE_PYARROW', False)
+        pandas_catalog = catalogs._read_catalog_csv(str(catalog_fpath),
+                                                    **dict(pdkwargs))
+
+        pd.testing.assert_frame_equal(pyarrow_catalog, pandas_catalog)
+
+
+def test_pyarrow_column_types():
+    '''
+    Only dicts of column names to plain numpy types should be translated.
+
+    '''
+
+    pa = pytest.importorskip('pyarrow')
+
+    assert catalogs._pyarrow_column_types(
+        {'ra':'float32', 'viz-id':'int64', 'dec':float}
+    ) == {'ra':pa.float32(), 'viz-id':pa.int64(), 'dec':pa.float64()}
+
+    assert catalogs._pyarrow_column_types('float32') is None
+    assert catalogs._pyarrow_column_types({0:'float32'}) is None
+
+    for dtype in ('category', 'Int64', 'string', 'object'):
+        assert catalogs._pyarrow_column_types({'name':dtype}) is None
+
+
+@pytest.mark.parametrize(
+    'pattern, expected',
+    [('hugs-{objectid}.png', ['hugs-1.png', 'hugs-23.png']),
+     ('{objectid}', ['1', '23']),
+     ('images/{objectid}/cutout.png',
+      ['images/1/cutout.png', 'images/23/cutout.png']),
+     ('hugs-{objectid:05d}.png', ['hugs-00001.png', 'hugs-00023.png']),
+     ('{objectid}-{objectid}.png', ['1-1.png', '23-23.png'])]
+)
+def test_image_filenames(pattern, expected):
+    '''
+    The fast prefix/suffix path should give the same names as str.format.
+
+    '''
+
+    assert catalogs._image_filenames(pattern, [1, 23]) == expected
+    assert expected == [pattern.format(objectid=x) for x in (1, 23)]
+
+
+@pytest.mark.parametrize('have_numexpr', (False, True))
+def test_add_catalog_colors(monkeypatch, have_numexpr):
+    '''
+    The g-i and g-r colors should match the plain pandas expressions.
+
+    '''
+
+    import numpy as np
+    import pandas as pd
+
+    if have_numexpr:
+        pytest.importorskip('numexpr')
+    monkeypatch.setattr(catalogs, 'HAVE_NUMEXPR', have_numexpr)
+
+    rng = np.random.RandomState(42)
+    catalog = pd.DataFrame(
+        {x:rng.uniform(0.0, 25.0, 10) for x in catalogs.COLOR_COLUMNS}
+    )
+    catalogs._add_catalog_colors(catalog)
+
+    np.testing.assert_allclose(
+        catalog['g-i'],
+        (catalog['m_tot_forced_g'] - catalog['m_tot'] -
+         catalog['A_g'] + catalog['A_i'])
+    )
+    np.testing.assert_allclose(
+        catalog['g-r'],
+        (catalog['m_tot_forced_g'] - catalog['m_tot_forced_r'] -
+         catalog['A_g'] + catalog['A_r'])
+    )
+
+    # nothing is added if any of the magnitude columns are missing
+    catalog = catalog.drop(columns=['g-i', 'g-r', 'A_r'])
+    catalogs._add_catalog_colors(catalog)
+    assert 'g-i' not in catalog.columns
+    assert 'g-r' not in catalog.columns
+
+
+def test_catalog_rows(monkeypatch):
+    '''
+    The rows should be the same no matter how the catalog is chunked.
+
+    '''
+
+    import json
+    from datetime import datetime, timezone
+    import pandas as pd
+
+    monkeypatch.setattr(catalogs, 'COPY_CHUNK_ROWS', 2)
+
+    catalog = pd.DataFrame({
+        'viz-id':[10, 11, 12],
+        'ra':[1.0, 2.0, 3.0],
+        'dec':[-1.0, -2.0, -3.0],
+        'name':['a', 'b', 'c'],
+        'mag':[20.5, 21.5, 22.5],
+    })
+    now = datetime(2019, 8, 1, 12, 0, tzinfo=timezone.utc)
+
+    rows = list(catalogs._catalog_rows(catalog,
+                                       [10, 11, 12],
+                                       ('candy', 'junk'),
+                                       now))
+
+    assert len(rows) == 3
+    for row, (objectid, ra, dec, name, mag) in zip(
+            rows, catalog.itertuples(index=False)
+    ):
+        assert row[:3] == (objectid, ra, dec)
+        assert json.loads(row[3]) == {'candy':0, 'junk':0}
+        assert row[4] == {'name':name, 'mag':mag}
+        assert row[5:] == ('incomplete', now.isoformat(), now.isoformat())
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+This checks that `database.json_dumps` gives the same JSON whether or not orjson
+is used to make it.
+
+'''
+
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('sqlalchemy')
+
+from vizinspect.backend import database
+
+
+def test_json_dumps_orjson_matches_stdlib(monkeypatch):
+    '''
+    The orjson and stdlib json paths should serialize to the same values.
+
+    '''
+
+    pytest.importorskip('orjson')
+
+    obj = {
+        'float':1.5,
+        'int':2,
+        'str':'candy',
+        'none':None,
+        'nan':float('nan'),
+        'list':[1, 2.5, 'x'],
+        'nested':{'candy':0, 'junk':1},
+        'np_float':np.float64(2.5),
+        'np_int':np.int64(3),
+        'np_array':np.arange(3),
+        'datetime':datetime(2019, 8, 1, 12, 0, tzinfo=timezone.utc),
+        1:'int key',
+    }
+
+    monkeypatch.setattr(database, 'HAVE_ORJSON', True)
+    orjson_dumped = database.json_dumps(obj)
+
+    monkeypatch.setattr(database, 'HAVE_ORJSON', False)
+    stdlib_dumped = database.json_dumps(obj)
+
+    assert json.loads(orjson_dumped) == json.loads(stdlib_dumped)
+    assert json.loads(stdlib_dumped)['nan'] is None
@@ -929,11 +929,23 @@ def auth_user_login(payload,
 
             if user_info:
 
-                pass_ok = authdb.password_context.verify(
+                pass_ok, new_hash = authdb.password_context.verify_and_update(
                     payload['password'][:1024],
                     user_info['password']
                 )
 
+                # if the stored hash was made with older hash settings,
+                # replace it with one made using the current settings
+                if pass_ok and new_hash is not None:
+                    upd = users.update(
+                    ).where(
+                        users.c.user_id == user_info['user_id']
+                    ).values({
+                        'password': new_hash
+                    })
+                    result = currproc.connection.execute(upd)
+                    result.close()
+
             else:
 
                 authdb.password_context.verify('nope',
@@ -17,8 +17,9 @@ import secrets
 import getpass
 
 from sqlalchemy import create_engine
-from sqlalchemy.engine import Engine
 from sqlalchemy import event
+from sqlalchemy import select
+from sqlalchemy.pool import QueuePool
 from sqlalchemy import (
     Table, Column, Integer, String, Text,
     Boolean, DateTime, ForeignKey, MetaData
@@ -65,6 +66,8 @@ class JSONEncodedDict(TypeDecorator):
 #############################
 
 # https://passlib.readthedocs.io/en/stable/narr/quickstart.html
+# this uses passlib's default argon2 settings. password hashes made with other
+# settings are replaced on the next login.
 password_context = CryptContext(schemes=['argon2','bcrypt'],
                                 deprecated='auto')
 
@@ -687,6 +690,40 @@ pragma journal_mode = 'wal';
 pragma journal_size_limit = 5242880;
 '''
 
+# these are run on every new connection to an SQLite auth DB. WAL mode lets
+# readers in other worker processes proceed while a write is going on, and the
+# busy timeout makes writers wait for each other instead of failing right away.
+SQLITE_CONNECT_PRAGMAS = (
+    'pragma foreign_keys = ON',
+    'pragma journal_mode = WAL',
+    'pragma synchronous = NORMAL',
+    'pragma busy_timeout = 30000',
+    'pragma cache_size = -64000',
+    'pragma mmap_size = 268435456',
+)
+
+# the connection pool settings for SQLite auth DB engines
+SQLITE_POOL_KWARGS = {
+    'poolclass':QueuePool,
+    'pool_size':5,
+    'max_overflow':10,
+    'pool_pre_ping':True,
+    'connect_args':{'check_same_thread':False, 'timeout':30},
+}
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    '''
+    This sets up the SQLite PRAGMAs on a new auth DB connection.
+
+    '''
+
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_CONNECT_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+
 def create_sqlite_auth_db(
         auth_db_path,
         echo=False,
@@ -737,13 +774,14 @@ def get_auth_db(auth_db_path, echo=False):
         if not (fileperm == '0100600' or fileperm == '0o100600'):
             raise IOError('incorrect permissions on auth DB, will not load it')
 
-        @event.listens_for(Engine, "connect")
-        def set_sqlite_pragma(dbapi_connection, connection_record):
-            cursor = dbapi_connection.cursor()
-            cursor.execute("PRAGMA foreign_keys=ON")
-            cursor.close()
+    # for SQLite, use a connection pool so connections are re-used instead of
+    # being opened and set up again for every request
+    if 'sqlite' in auth_db_path:
+        engine = create_engine(auth_db_path, echo=echo, **SQLITE_POOL_KWARGS)
+        event.listen(engine, 'connect', set_sqlite_pragmas)
+    else:
+        engine = create_engine(auth_db_path, echo=echo)
 
-    engine = create_engine(auth_db_path, echo=echo)
     AUTHDB_META.bind = engine
     conn = engine.connect()
 
@@ -849,6 +887,51 @@ def initial_authdb_inserts(auth_db_path,
 
 
 
+def update_dummy_user_password(auth_db_path):
+    '''This rehashes the dummy user's password if the hash settings changed.
+
+    Failed logins for unknown users verify a password against the dummy user's
+    hash so they take as long as a real failed login. The real users' hashes
+    are upgraded to the current `password_context` settings when they log in,
+    but the dummy user never does, so this is run at startup to keep its hash
+    on the same settings. Otherwise, logins for existing users would take
+    measurably longer than logins for nonexistent ones.
+
+    Returns True if the dummy user's password was rehashed.
+
+    '''
+
+    engine, conn, meta = get_auth_db(auth_db_path)
+    users = meta.tables['users']
+
+    try:
+
+        res = conn.execute(
+            select([users.c.password]).where(users.c.user_id == 3)
+        )
+        dummy_row = res.fetchone()
+        res.close()
+
+        if (dummy_row is None or
+            not password_context.needs_update(dummy_row['password'])):
+            return False
+
+        upd = users.update().where(users.c.user_id == 3).values({
+            'password':password_context.hash(secrets.token_urlsafe(32)),
+            'last_updated':datetime.utcnow()
+        })
+        res = conn.execute(upd)
+        res.close()
+
+        return True
+
+    finally:
+
+        conn.close()
+        meta.bind = None
+        engine.dispose()
+
+
 def get_secret_token(token_environvar,
                      token_file,
                      logger):
@@ -52,6 +52,7 @@ json._default_encoder = FrontendEncoder()
 
 import ipaddress
 import base64
+from functools import lru_cache
 
 import multiprocessing as mp
 
@@ -83,13 +84,26 @@ def check_host(remote_ip):
         return False
 
 
+@lru_cache(maxsize=8)
+def get_fernet(fernet_key):
+    '''
+    This returns a Fernet instance for the key.
+
+    The instance is only made once per key and re-used after that, so we don't
+    have to set up the keys again for every request.
+
+    '''
+
+    return Fernet(fernet_key)
+
+
 def decrypt_request(requestbody_base64, fernet_key):
     '''
     This decrypts the incoming request.
 
     '''
 
-    frn = Fernet(fernet_key)
+    frn = get_fernet(fernet_key)
 
     try:
 
@@ -114,7 +128,7 @@ def encrypt_response(response_dict, fernet_key):
 
     '''
 
-    frn = Fernet(fernet_key)
+    frn = get_fernet(fernet_key)
 
     json_bytes = json.dumps(response_dict).encode()
     json_encrypted_bytes = frn.encrypt(json_bytes)
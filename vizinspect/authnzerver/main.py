@@ -29,6 +29,7 @@ import socket
 import sys
 import signal
 import time
+import getpass
 from functools import partial
 
 # setup signal trapping on SIGINT
@@ -40,100 +41,193 @@ def _recv_sigint(signum, stack):
     raise KeyboardInterrupt
 
 
+# forked server processes write their PIDs to this pipe when they start, so the
+# parent process can signal them when it's asked to stop. this is a tuple of the
+# (read, write) file descriptors once the pipe is made.
+_SERVER_PID_PIPE = None
+
+
+def _register_server_process():
+    '''
+    this is called in each forked server process (including any restarted by
+    the parent) to send its PID to the parent
+
+    '''
+    read_fd, write_fd = _SERVER_PID_PIPE
+    os.close(read_fd)
+    os.write(write_fd, ('%s\n' % os.getpid()).encode())
+    os.close(write_fd)
+
+
+def _recv_parent_signal(signum, stack):
+    '''
+    handler function for SIGINT and SIGTERM in the parent of forked server
+    processes. this sends SIGINT to each server process so they shut down
+    cleanly instead of being orphaned, then exits. the background workers
+    ignore SIGINT, so their server processes shut them down.
+
+    '''
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    read_fd, write_fd = _SERVER_PID_PIPE
+    os.set_blocking(read_fd, False)
+
+    pid_data = b''
+    try:
+        while True:
+            chunk = os.read(read_fd, 4096)
+            if not chunk:
+                break
+            pid_data += chunk
+    except BlockingIOError:
+        pass
+
+    # the PIDs of server processes that died and were restarted may have been
+    # reused since, so only signal PIDs that are still our running children
+    for pid in {int(x) for x in pid_data.split()}:
+        try:
+            if os.waitpid(pid, os.WNOHANG) == (0, 0):
+                os.kill(pid, signal.SIGINT)
+        except (ChildProcessError, ProcessLookupError):
+            pass
+
+    sys.exit(0)
+
+
 #####################
 ## TORNADO IMPORTS ##
 #####################
 
-# experimental, probably will remove at some point
-try:
-    import asyncio
-    import uvloop
-    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
-    IOLOOP_SPEC = 'uvloop'
-except Exception as e:
-    HAVE_UVLOOP = False
-    IOLOOP_SPEC = 'asyncio'
-
+import asyncio
 import tornado.ioloop
 import tornado.httpserver
+import tornado.netutil
+import tornado.process
 import tornado.web
 import tornado.options
 from tornado.options import define, options
 import multiprocessing as mp
 
+from .authdb import (
+    create_sqlite_auth_db,
+    initial_authdb_inserts,
+    get_auth_db
+)
+
 ###############################
 ### APPLICATION SETUP BELOW ###
 ###############################
 
 modpath = os.path.abspath(os.path.dirname(__file__))
 
-# define our commandline options
-
-# the port to serve on
-define('port',
-       default=12690,
-       help='Run on the given port.',
-       type=int)
-
-# the address to listen on
-define('serve',
-       default='127.0.0.1',
-       help='Bind to given address and serve content.',
-       type=str)
-
-# whether to run in debugmode or not
-define('debugmode',
-       default=0,
-       help='start up in debug mode if set to 1.',
-       type=int)
-
-# number of background threads in the pool executor
-define('backgroundworkers',
-       default=4,
-       help=('number of background workers to use '),
-       type=int)
-
-# basedir is the directory at the root where this server stores its auth DB and
-# looks for secret keys.
-define('basedir',
-       default=os.getcwd(),
-       help=('The base directory containing secret files and the auth DB.'),
-       type=str)
-
-# the path to the authentication DB
-define('authdb',
-       default=None,
-       help=('An SQLAlchemy database URL to override the use of '
-             'the local authentication DB. '
-             'This should be in the form discussed at: '
-             'https://docs.sqlalchemy.org/en/latest'
-             '/core/engines.html#database-urls'),
-       type=str)
-
-# the path to the cache directory used to enforce API limits
-define('cachedir',
-       default='/tmp/vizinspect-cache',
-       help=('Path to the cache directory used by the authnzerver.'),
-       type=str)
-
-
-# the environment variable to get FERNETSECRET from.
-define('secretenv',
-       default='FERNETSECRET',
-       help=('The environment variable used to get the secret key.'),
-       type=str)
-
-# the path to the secret file to get FERNETSECRET from.
-define('secretfile',
-       default='.server.secret-fernet',
-       help=('Path to the file containing the secret key. '
-             'This is relative to the path given in the basedir option.'),
-       type=str)
-
-define('sessionexpiry',
-       default=30,
-       help=('This sets the session-expiry time in days.'),
-       type=int)
+
+def _define_option(name, **kwargs):
+    '''This defines a command line option if it isn't already defined.
+
+    Tornado raises an error if an option is defined twice, which happens if
+    `define_options` is called again or another module in this process already
+    defined an option with the same name.
+
+    '''
+
+    if name not in options:
+        define(name, **kwargs)
+
+
+def define_options():
+    '''This defines our command line options.
+
+    This is called by `main` instead of at import time, so importing this module
+    doesn't touch the global tornado options registry.
+
+    '''
+
+    # the port to serve on
+    _define_option('port',
+                   default=12690,
+                   help=('Run on the given port. '
+                         'If 0, a free port will be picked.'),
+                   type=int)
+
+    # the address to listen on
+    _define_option('serve',
+                   default='127.0.0.1',
+                   help='Bind to given address and serve content.',
+                   type=str)
+
+    # whether to run in debugmode or not
+    _define_option('debugmode',
+                   default=0,
+                   help='start up in debug mode if set to 1.',
+                   type=int)
+
+    # whether to use uvloop for the event loop or not
+    _define_option('uvloop',
+                   default=1,
+                   help=('use uvloop for the event loop if set to 1. '
+                         'set this to 0 to use the default asyncio '
+                         'event loop.'),
+                   type=int)
+
+    # number of server processes to fork
+    _define_option('serverprocesses',
+                   default=1,
+                   help=('number of server processes to run. each process '
+                         'gets its own background workers. if 0, one process '
+                         'per CPU is run.'),
+                   type=int)
+
+    # number of background threads in the pool executor
+    _define_option('backgroundworkers',
+                   default=4,
+                   help=('number of background workers to use '),
+                   type=int)
+
+    # basedir is the directory at the root where this server stores its auth DB
+    # and looks for secret keys.
+    _define_option('basedir',
+                   default=os.getcwd(),
+                   help=('The base directory containing secret files '
+                         'and the auth DB.'),
+                   type=str)
+
+    # the path to the authentication DB
+    _define_option('authdb',
+                   default=None,
+                   help=('An SQLAlchemy database URL to override the use of '
+                         'the local authentication DB. '
+                         'This should be in the form discussed at: '
+                         'https://docs.sqlalchemy.org/en/latest'
+                         '/core/engines.html#database-urls'),
+                   type=str)
+
+    # the path to the cache directory used to enforce API limits
+    _define_option('cachedir',
+                   default='/tmp/vizinspect-cache',
+                   help=('Path to the cache directory used by '
+                         'the authnzerver.'),
+                   type=str)
+
+    # the environment variable to get FERNETSECRET from.
+    _define_option('secretenv',
+                   default='FERNETSECRET',
+                   help=('The environment variable used to get '
+                         'the secret key.'),
+                   type=str)
+
+    # the path to the secret file to get FERNETSECRET from.
+    _define_option('secretfile',
+                   default='.server.secret-fernet',
+                   help=('Path to the file containing the secret key. '
+                         'This is relative to the path given in the '
+                         'basedir option.'),
+                   type=str)
+
+    _define_option('sessionexpiry',
+                   default=30,
+                   help=('This sets the session-expiry time in days.'),
+                   type=int)
 
 
 #######################
@@ -144,17 +238,51 @@ def setup_auth_worker(authdb_path,
                       fernet_secret):
     '''This stores secrets and the auth DB path in the worker loop's context.
 
-    The worker will then open the DB and set up its Fernet instance by itself.
+    Also opens the auth DB engine and connection once for this worker, so
+    requests handled by it don't have to set them up.
 
     '''
+
     # unregister interrupt signals so they don't get to the worker
     # and the executor can kill them cleanly (hopefully)
     signal.signal(signal.SIGINT, signal.SIG_IGN)
 
+    setup_start = time.time()
+
     currproc = mp.current_process()
     currproc.auth_db_path = authdb_path
     currproc.fernet_secret = fernet_secret
 
+    # sets up the engine, connection, and metadata objects as process-local
+    # variables
+    currproc.engine, currproc.connection, currproc.table_meta = (
+        get_auth_db(authdb_path, echo=False)
+    )
+
+    print('Set up database engine in process: %s in %.3f seconds' %
+          (currproc.name, time.time() - setup_start),
+          file=sys.stdout)
+
+
+def warmup_auth_worker(workernum):
+    '''This is a no-op task submitted to each worker at startup.
+
+    Running it makes the executor start all of its workers and run
+    `setup_auth_worker` in them before the first actual request comes in.
+
+    '''
+
+    return mp.current_process().name
+
+
+
+# these are the process-local database objects and the functions used to clean
+# them up, in the order they should be cleaned up
+AUTHDB_CLEANUPS = (
+    ('table_meta', None),
+    ('connection', lambda x: x.close()),
+    ('engine', lambda x: x.dispose()),
+)
 
 
 def close_authentication_database():
@@ -165,16 +293,15 @@ def close_authentication_database():
     '''
 
     currproc = mp.current_process()
-    if getattr(currproc, 'table_meta', None):
-        del currproc.table_meta
 
-    if getattr(currproc, 'connection', None):
-        currproc.connection.close()
-        del currproc.connection
-
-    if getattr(currproc, 'engine', None):
-        currproc.engine.dispose()
-        del currproc.engine
+    # each item is removed from the process after it's cleaned up, so calling
+    # this function again won't close or dispose anything twice
+    for attr, cleanup_func in AUTHDB_CLEANUPS:
+        item = getattr(currproc, attr, None)
+        if item is not None:
+            if cleanup_func is not None:
+                cleanup_func(item)
+            delattr(currproc, attr)
 
     print('Shutting down database engine in process: %s' % currproc.name,
           file=sys.stdout)
@@ -192,8 +319,7 @@ def autogen_secrets_authdb(basedir, logger):
 
     '''
 
-    import getpass
-    from .authdb import create_sqlite_auth_db, initial_authdb_inserts
+    # this is only imported here because it's only needed on the first start
     from cryptography.fernet import Fernet
 
     # create our authentication database if it doesn't exist
@@ -281,7 +407,10 @@ def autogen_secrets_authdb(basedir, logger):
 
 def main():
 
+    global _SERVER_PID_PIPE
+
     # parse the command line
+    define_options()
     tornado.options.parse_command_line()
 
     DEBUG = True if options.debugmode == 1 else False
@@ -363,6 +492,82 @@ def main():
             "The local auth DB is missing or "
             "no SQLAlchemy database URL was provided to override it"
         )
+
+    # failed logins for unknown users are checked against the dummy user's
+    # password hash so they take as long as failed logins for real users. real
+    # users' hashes are upgraded when they log in, so upgrade the dummy user's
+    # hash here as well if the hash settings have changed.
+    if authdb.update_dummy_user_password(AUTHDB_PATH):
+        LOGGER.info('Rehashed the dummy user password with the current '
+                    'password hash settings.')
+
+    ######################################################
+    ## CLEAR THE CACHE AND REAP OLD SESSIONS ON STARTUP ##
+    ######################################################
+
+    # these are shared by all server processes, so they're done once here
+    # before the server processes are forked. this way, they don't race with
+    # server processes that are already handling requests, and they aren't run
+    # again if a server process is restarted.
+    removed_items = cache.cache_flush(
+        cache_dirname=options.cachedir
+    )
+    LOGGER.info('removed %s stale items from authdb cache' %
+                removed_items)
+
+    session_killer = partial(actions.auth_kill_old_sessions,
+                             session_expiry_days=options.sessionexpiry,
+                             override_authdb_path=AUTHDB_PATH)
+
+    # run once at start up. this opens the auth DB in this process, so close it
+    # again to keep the server processes from inheriting its connection.
+    session_killer()
+    close_authentication_database()
+
+    ###########################
+    ## BIND SOCKETS AND FORK ##
+    ###########################
+
+    # bind the listening sockets before forking so all server processes accept
+    # connections on the same sockets. if the port is set to 0, the kernel will
+    # pick a free port and we'll read it back from the socket.
+    try:
+        server_sockets = tornado.netutil.bind_sockets(options.port,
+                                                      address=options.serve)
+    except socket.error:
+        LOGGER.exception('Could not listen on %s:%s, giving up' %
+                         (options.serve, options.port))
+        sys.exit(1)
+
+    serverport = server_sockets[0].getsockname()[1]
+
+    # fork the server processes. this has to happen before the event loop and
+    # the background executor are set up so each process gets its own. the
+    # parent process stays in fork_processes and restarts any child that dies.
+    # if the parent is signalled to stop, it passes that on to the children
+    # before exiting. each child goes back to the default handlers until it
+    # registers its own below.
+    if options.serverprocesses != 1 and sys.platform != 'win32':
+        _SERVER_PID_PIPE = os.pipe()
+        signal.signal(signal.SIGINT, _recv_parent_signal)
+        signal.signal(signal.SIGTERM, _recv_parent_signal)
+        task_id = tornado.process.fork_processes(options.serverprocesses)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        _register_server_process()
+    else:
+        task_id = 0
+
+    # set up the event loop before anything touches the IOLoop. if uvloop is
+    # requested, it must be installed (it isn't available on Windows)
+    if options.uvloop == 1 and sys.platform != 'win32':
+        import uvloop
+        uvloop.install()
+        IOLOOP_SPEC = 'uvloop'
+    else:
+        IOLOOP_SPEC = 'asyncio'
+    asyncio.set_event_loop(asyncio.new_event_loop())
+
     #
     # this is the background executor we'll pass over to the handler
     #
@@ -372,6 +577,13 @@ def main():
                                       FERNETSECRET),
                             finalizer=close_authentication_database)
 
+    # start up all of the workers now so they open their DB connections before
+    # any requests come in
+    warmup_start = time.time()
+    list(executor.map(warmup_auth_worker, range(MAXWORKERS)))
+    LOGGER.info('Started %s background workers in %.3f seconds' %
+                (MAXWORKERS, time.time() - warmup_start))
+
     # we only have one actual endpoint, the other one is for testing
     handlers = [
         (r'/', AuthHandler,
@@ -407,22 +619,6 @@ def main():
     http_server = tornado.httpserver.HTTPServer(app)
 
 
-    ######################################################
-    ## CLEAR THE CACHE AND REAP OLD SESSIONS ON STARTUP ##
-    ######################################################
-
-    removed_items = cache.cache_flush(
-        cache_dirname=options.cachedir
-    )
-    LOGGER.info('removed %s stale items from authdb cache' % removed_items)
-
-    session_killer = partial(actions.auth_kill_old_sessions,
-                             session_expiry_days=options.sessionexpiry,
-                             override_authdb_path=AUTHDB_PATH)
-
-    # run once at start up
-    session_killer()
-
     ######################
     ## start the server ##
     ######################
@@ -431,28 +627,10 @@ def main():
     signal.signal(signal.SIGINT, _recv_sigint)
     signal.signal(signal.SIGTERM, _recv_sigint)
 
-    # make sure the port we're going to listen on is ok
-    # inspired by how Jupyter notebook does this
-    portok = False
-    serverport = options.port
-    maxtries = 10
-    thistry = 0
-    while not portok and thistry < maxtries:
-        try:
-            http_server.listen(serverport, options.serve)
-            portok = True
-        except socket.error as e:
-            LOGGER.warning('%s:%s is already in use, trying port %s' %
-                           (options.serve, serverport, serverport + 1))
-            serverport = serverport + 1
-
-    if not portok:
-        LOGGER.error('Could not find a free port after %s tries, giving up' %
-                     maxtries)
-        sys.exit(1)
+    http_server.add_sockets(server_sockets)
 
-    LOGGER.info('Started authnzerver. listening on http://%s:%s' %
-                (options.serve, serverport))
+    LOGGER.info('Started authnzerver process %s. listening on http://%s:%s' %
+                (task_id, options.serve, serverport))
     LOGGER.info('Background worker processes: %s. IOLoop in use: %s' %
                 (MAXWORKERS, IOLOOP_SPEC))
     LOGGER.info('Base directory is: %s' % os.path.abspath(options.basedir))
@@ -465,12 +643,13 @@ def main():
 
         # add our periodic callback for the session-killer
         # runs daily
-        periodic_session_kill = tornado.ioloop.PeriodicCallback(
-            session_killer,
-            86400000.0,
-            jitter=0.1,
-        )
-        periodic_session_kill.start()
+        if task_id == 0:
+            periodic_session_kill = tornado.ioloop.PeriodicCallback(
+                session_killer,
+                86400000.0,
+                jitter=0.1,
+            )
+            periodic_session_kill.start()
 
         # start the IOLoop
         loop.start()
@@ -479,26 +658,19 @@ def main():
 
         LOGGER.info('Received Ctrl-C: shutting down...')
 
-        # close down the processpool
-        executor.shutdown()
-        time.sleep(2)
-
-        tornado.ioloop.IOLoop.instance().stop()
+        # a Ctrl-C from a terminal reaches this process both directly and via
+        # the parent process if the server processes were forked, so ignore any
+        # further interrupts while shutting down
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
 
-        currproc = mp.current_process()
-        if getattr(currproc, 'table_meta', None):
-            del currproc.table_meta
+        # close down the processpool. this blocks until the workers have
+        # exited, so there's no need to wait for them separately
+        executor.shutdown(wait=True, cancel_futures=True)
 
-        if getattr(currproc, 'connection', None):
-            currproc.connection.close()
-            del currproc.connection
-
-        if getattr(currproc, 'engine', None):
-            currproc.engine.dispose()
-            del currproc.engine
+        tornado.ioloop.IOLoop.instance().stop()
 
-        print('Shutting down database engine in process: %s' % currproc.name,
-              file=sys.stdout)
+        close_authentication_database()
 
 
 # run the server
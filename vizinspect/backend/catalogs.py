@@ -37,8 +37,35 @@ LOGEXCEPTION = LOGGER.exception
 #############
 
 import os.path
+import re
+import time
+import io
+import csv
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from threading import Lock
+import numpy as np
 import pandas as pd
 
+# pyarrow's CSV reader is multithreaded and much faster than the pandas one, so
+# we'll use it for reading catalogs if it's available
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pacsv
+    from pyarrow import feather as pafeather
+    HAVE_PYARROW = True
+except Exception:
+    HAVE_PYARROW = False
+
+# numexpr evaluates the color expressions in a single blocked pass over the
+# magnitude columns, so we'll use it if it's available
+try:
+    import numexpr as ne
+    HAVE_NUMEXPR = True
+except Exception:
+    HAVE_NUMEXPR = False
+
 try:
 
     from datetime import datetime, timezone, timedelta
@@ -63,23 +90,783 @@ except Exception:
 
     utc = UTC()
 
-from sqlalchemy import select, update, func, distinct, or_
+from sqlalchemy import select, update, func, exists, bindparam, inspect
 from sqlalchemy.dialects import postgresql as pg
+from sqlalchemy.util import LRUCache
 
 import markdown
 import bleach
 
-from tqdm import tqdm
-
 from .database import get_postgres_db, json_dumps
 
 
+#######################
+## COMMENT RENDERING ##
+#######################
+
+# these are set up once per process since building the html5lib-based
+# sanitizer and the Markdown instance with its default extensions is much more
+# expensive than actually running them on a short comment
+_COMMENT_CLEANER = bleach.sanitizer.Cleaner(strip=True)
+_COMMENT_MARKDOWN = markdown.Markdown(output_format='html5')
+
+# neither of these are safe to share between threads, so calls are serialized in
+# case this module is used from a thread pool instead of worker processes
+_COMMENT_RENDER_LOCK = Lock()
+
+
+def _render_comment(comment_text):
+    '''This bleaches and markdown-renders a comment.
+
+    Parameters
+    ----------
+
+    comment_text : str
+        The raw comment text from the user.
+
+    Returns
+    -------
+
+    str
+        The sanitized comment as rendered HTML.
+
+    '''
+
+    with _COMMENT_RENDER_LOCK:
+        cleaned_comment = _COMMENT_CLEANER.clean(comment_text)
+        _COMMENT_MARKDOWN.reset()
+        return _COMMENT_MARKDOWN.convert(cleaned_comment)
+
+
+##################
+## DATABASE GET ##
+##################
+
+# this holds the engines made for database URLs so their connection pools can be
+# reused across calls. these are keyed by process ID as well, so a forked worker
+# process never uses connections it inherited from its parent.
+_DB_ENGINES = {}
+
+
+@contextmanager
+def _dbconn(dbinfo, dbkwargs=None):
+    '''This gets the database connection and metadata to use from `dbinfo`.
+
+    `dbinfo` is a tuple of the database URL or connection instance, and the
+    database metadata object. If the database URL is provided, this gets a
+    connection from a pooled engine for that URL, making the engine with the
+    JSON serializer for the JSONB columns set on first use. The connection goes
+    back to the pool when the with-block exits. To skip pooling, pass
+    `{'engine_kwargs':{'poolclass':sqlalchemy.pool.NullPool}}` as `dbkwargs`.
+    If the connection is provided, it's re-used and left open.
+
+    '''
+
+    dbref, dbmeta = dbinfo
+
+    if isinstance(dbref, str) and 'postgres' in dbref:
+
+        dbkwargs = dict(dbkwargs) if dbkwargs else {}
+        engine_key = (os.getpid(), dbref, repr(sorted(dbkwargs.items())))
+
+        engine_kwargs = dict(dbkwargs.get('engine_kwargs', {}))
+        engine_kwargs['json_serializer'] = json_dumps
+        engine_kwargs.setdefault('pool_pre_ping', True)
+        dbkwargs['engine_kwargs'] = engine_kwargs
+
+        if dbkwargs.get('use_engine') is None:
+            dbkwargs['use_engine'] = _DB_ENGINES.get(engine_key)
+
+        engine, conn, meta = get_postgres_db(dbref,
+                                             dbmeta,
+                                             **dbkwargs)
+        _DB_ENGINES[engine_key] = engine
+
+        try:
+            yield conn, meta
+        finally:
+            # this returns the connection to the engine's pool
+            conn.close()
+
+    elif isinstance(dbref, str) and 'postgres' not in dbref:
+        raise NotImplementedError(
+            "viz-inspect currently doesn't support non-Postgres databases."
+        )
+
+    else:
+        meta = dbmeta
+        meta.bind = dbref
+        yield dbref, meta
+
+
 #########################
 ## LOADING THE CATALOG ##
 #########################
 
 DEFAULT_FLAGS = ('candy','galaxy', 'outskirts', 'junk', 'tidal', 'cirrus')
 
+# these are the magnitude and extinction columns used to make the g-i and g-r
+# colors when loading the catalog
+COLOR_COLUMNS = ('m_tot_forced_g', 'm_tot', 'm_tot_forced_r',
+                 'A_g', 'A_i', 'A_r')
+
+# these are the pandas.read_csv kwargs that we know how to translate to their
+# pyarrow.csv equivalents. if any other kwargs are passed in, we'll fall back to
+# using pandas to read the catalog.
+PYARROW_CSV_KWARGS = ('usecols', 'na_values', 'dtype')
+
+# the size of each block of the CSV read in by a pyarrow reader thread
+PYARROW_CSV_BLOCKSIZE = 8 << 20
+
+# this is appended to the catalog file path to get the path of its parsed cache
+CATALOG_CACHE_SUFFIX = '.cached.feather'
+
+# the options used to read the catalog are stored under this key in the parsed
+# cache's schema metadata
+CATALOG_CACHE_OPTIONS_KEY = b'vizinspect.read_options'
+
+# these columns are always read from the catalog, even if `columns` is provided
+# to load_catalog
+REQUIRED_COLUMNS = ('ra', 'dec', 'viz-id')
+
+# image directories with these prefixes are in object storage, so the image
+# files aren't checked when loading the catalog
+REMOTE_IMAGE_PREFIXES = ('dos://', 's3://')
+
+# the number of rows sent to the database in each COPY when loading the catalog
+COPY_CHUNK_ROWS = 50000
+
+# the number of threads used to check if image files exist when loading the
+# catalog and the image file pattern points into subdirectories. this is kept
+# modest so we don't swamp an NFS server with stat calls.
+IMAGE_CHECK_THREADS = 32
+
+# this is a dtype map that can be passed to load_catalog as `dtype_map` to read
+# the magnitude and extinction columns as float32 instead of float64. this halves
+# their memory use, at the cost of their values not round-tripping exactly when
+# they're written out to the database.
+FLOAT32_DTYPE_MAP = {
+    'm_tot':'float32',
+    'm_tot_forced_g':'float32',
+    'm_tot_forced_r':'float32',
+    'A_g':'float32',
+    'A_i':'float32',
+    'A_r':'float32',
+    'id':'int64',
+}
+
+
+def _pyarrow_column_types(dtype):
+    '''This translates a pandas `dtype` kwarg to pyarrow CSV column types.
+
+    Returns None if `dtype` isn't a dict of column names to plain numpy types,
+    e.g. if it's a single type for all columns or has pandas extension types
+    like 'category', 'Int64', or 'string' that pyarrow can't read directly.
+
+    '''
+
+    if not isinstance(dtype, dict):
+        return None
+
+    column_types = {}
+
+    for column, column_dtype in dtype.items():
+
+        if not isinstance(column, str):
+            return None
+
+        try:
+            np_dtype = pd.api.types.pandas_dtype(column_dtype)
+            if not isinstance(np_dtype, np.dtype):
+                return None
+            column_types[column] = pa.from_numpy_dtype(np_dtype)
+        except (TypeError, ValueError, NotImplementedError, pa.ArrowException):
+            return None
+
+    return column_types
+
+
+def _read_catalog_csv(catalog_fpath, **pdkwargs):
+    '''This reads a catalog CSV into a pandas DataFrame.
+
+    Uses the pyarrow CSV reader if it's available and all of the `pdkwargs` can
+    be translated to its options. Otherwise, falls back to `pandas.read_csv`.
+
+    '''
+
+    use_pyarrow = (
+        HAVE_PYARROW and
+        all(x in PYARROW_CSV_KWARGS for x in pdkwargs)
+    )
+
+    # per-column na_values can't be translated to pyarrow's null_values, which
+    # apply to every column
+    na_values = pdkwargs.get('na_values', None)
+    if isinstance(na_values, dict):
+        use_pyarrow = False
+
+    dtype = pdkwargs.get('dtype', None)
+    if use_pyarrow and dtype is not None:
+        column_types = _pyarrow_column_types(dtype)
+        use_pyarrow = column_types is not None
+
+    if use_pyarrow:
+
+        # these match what pandas does: empty and NaN-like strings become nulls
+        # in string columns too, and timestamps are left as strings
+        convert_options = pacsv.ConvertOptions(
+            strings_can_be_null=True,
+            timestamp_parsers=[],
+        )
+
+        usecols = pdkwargs.get('usecols', None)
+        if usecols is not None:
+            convert_options.include_columns = list(usecols)
+
+        # pandas adds na_values to its default NaN strings, so do the same here
+        if isinstance(na_values, str):
+            na_values = [na_values]
+        if na_values is not None:
+            convert_options.null_values = (
+                list(convert_options.null_values) + list(na_values)
+            )
+
+        if dtype is not None:
+            convert_options.column_types = column_types
+
+        read_options = pacsv.ReadOptions(
+            use_threads=True,
+            block_size=PYARROW_CSV_BLOCKSIZE
+        )
+
+        table = pacsv.read_csv(catalog_fpath,
+                               read_options=read_options,
+                               convert_options=convert_options)
+        catalog = table.to_pandas(split_blocks=True, self_destruct=True)
+        del table
+
+        return catalog
+
+    else:
+        pdkwargs.setdefault('engine', 'c')
+        pdkwargs.setdefault('low_memory', False)
+        return pd.read_csv(catalog_fpath, **pdkwargs)
+
+
+def _read_catalog(catalog_fpath, **pdkwargs):
+    '''This reads a catalog file into a pandas DataFrame.
+
+    Parquet (.parquet) and Feather (.feather) files are read directly with only
+    the columns in `usecols` (if provided) and then cast to the types in `dtype`
+    (if provided). Everything else is assumed to be a CSV and is read using
+    `_read_catalog_csv`.
+
+    '''
+
+    catalog_ext = os.path.splitext(catalog_fpath)[-1].lower()
+    usecols = pdkwargs.get('usecols', None)
+    if usecols is not None:
+        usecols = list(usecols)
+
+    if catalog_ext == '.parquet':
+        catalog = pd.read_parquet(catalog_fpath,
+                                  engine='pyarrow',
+                                  columns=usecols)
+
+    elif catalog_ext == '.feather':
+        catalog = pd.read_feather(catalog_fpath,
+                                  columns=usecols)
+
+    else:
+        return _read_catalog_csv(catalog_fpath, **pdkwargs)
+
+    dtype = pdkwargs.get('dtype', None)
+    if dtype is not None:
+        catalog = catalog.astype(
+            {k:v for k, v in dtype.items() if k in catalog.columns},
+            copy=False
+        )
+
+    return catalog
+
+
+def _read_catalog_chunks(catalog_fpath, chunksize, **pdkwargs):
+    '''This reads a catalog CSV `chunksize` rows at a time.
+
+    This is a generator that yields each chunk as a pandas DataFrame with the
+    catalog colors added.
+
+    '''
+
+    pdkwargs.setdefault('engine', 'c')
+
+    reader = pd.read_csv(catalog_fpath, chunksize=chunksize, **pdkwargs)
+
+    try:
+        for catalog in reader:
+            _add_catalog_colors(catalog)
+            yield catalog
+    finally:
+        reader.close()
+
+
+def convert_catalog_to_parquet(catalog_fpath,
+                               parquet_fpath=None,
+                               compression='zstd',
+                               **pdkwargs):
+    '''This converts a catalog CSV to a Parquet file.
+
+    Loading a catalog from a Parquet file is much faster than from a CSV, so
+    this can be run once on an existing catalog CSV and the resulting file
+    passed to `load_catalog` afterwards.
+
+    Parameters
+    ----------
+
+    catalog_fpath : str
+        The path to the catalog CSV to convert.
+
+    parquet_fpath : str or None
+        The path to the output Parquet file. If None, this will be the same as
+        `catalog_fpath`, but with its extension replaced by '.parquet'.
+
+    compression : str
+        The compression codec to use for the Parquet file.
+
+    pdkwargs : extra keyword arguments
+        All of these will passed directly to the `pandas.read_csv` function.
+
+    Returns
+    -------
+
+    str
+        The path to the Parquet file written.
+
+    '''
+
+    if parquet_fpath is None:
+        parquet_fpath = '%s.parquet' % os.path.splitext(catalog_fpath)[0]
+
+    catalog = _read_catalog_csv(catalog_fpath, **pdkwargs)
+
+    # store any low-cardinality string columns as dictionary encoded columns
+    for col in catalog.select_dtypes(include='object').columns:
+        if catalog[col].nunique() < len(catalog)/2:
+            catalog[col] = catalog[col].astype('category')
+
+    # write to a temporary file first so an interrupted write doesn't leave a
+    # truncated Parquet file behind. the temporary file is removed if the write
+    # fails for any reason, including a KeyboardInterrupt.
+    parquet_tmp_fpath = '%s.tmp' % parquet_fpath
+    try:
+        catalog.to_parquet(parquet_tmp_fpath,
+                           engine='pyarrow',
+                           compression=compression,
+                           index=False)
+        os.replace(parquet_tmp_fpath, parquet_fpath)
+    except BaseException:
+        try:
+            os.remove(parquet_tmp_fpath)
+        except OSError:
+            pass
+        raise
+
+    LOGINFO('Converted catalog %s to Parquet file: %s' %
+            (catalog_fpath, parquet_fpath))
+    return parquet_fpath
+
+
+def _add_catalog_colors(catalog):
+    '''This adds the extinction-corrected g-i and g-r colors to the catalog.
+
+    The colors are only added if the catalog has the magnitude columns needed
+    for them. If numexpr is available, each color is evaluated as one fused
+    expression. Otherwise, these are done in-place on the column arrays so we
+    don't make a new intermediate Series for each term.
+
+    '''
+
+    if not all(x in catalog.columns for x in COLOR_COLUMNS):
+        return
+
+    mag_g = catalog['m_tot_forced_g'].to_numpy()
+    ext_g = catalog['A_g'].to_numpy()
+
+    if HAVE_NUMEXPR:
+
+        coldict = {
+            'mag_g':mag_g,
+            'ext_g':ext_g,
+            'mag_i':catalog['m_tot'].to_numpy(),
+            'ext_i':catalog['A_i'].to_numpy(),
+            'mag_r':catalog['m_tot_forced_r'].to_numpy(),
+            'ext_r':catalog['A_r'].to_numpy(),
+        }
+        catalog['g-i'] = ne.evaluate('mag_g - mag_i - ext_g + ext_i',
+                                     local_dict=coldict)
+        catalog['g-r'] = ne.evaluate('mag_g - mag_r - ext_g + ext_r',
+                                     local_dict=coldict)
+        return
+
+    # g-i = (m_g - m_i) - A_g + A_i
+    gi_color = np.empty_like(mag_g)
+    np.subtract(mag_g, catalog['m_tot'].to_numpy(), out=gi_color)
+    np.subtract(gi_color, ext_g, out=gi_color)
+    np.add(gi_color, catalog['A_i'].to_numpy(), out=gi_color)
+    catalog['g-i'] = gi_color
+
+    # g-r = (m_g - m_r) - A_g + A_r
+    gr_color = np.empty_like(mag_g)
+    np.subtract(mag_g, catalog['m_tot_forced_r'].to_numpy(), out=gr_color)
+    np.subtract(gr_color, ext_g, out=gr_color)
+    np.add(gr_color, catalog['A_r'].to_numpy(), out=gr_color)
+    catalog['g-r'] = gr_color
+
+
+def _catalog_read_options(pdkwargs):
+    '''This makes the key stored with the parsed cache for the read options.
+
+    '''
+
+    return repr(sorted(pdkwargs.items())).encode()
+
+
+def _read_cached_catalog(catalog_fpath, pdkwargs, catalog_mtime=None):
+    '''This reads the parsed catalog from its Feather cache file.
+
+    The cache file is memory-mapped while it's read, so it isn't read into a
+    separate buffer first. The returned DataFrame is still a copy of the cached
+    data and isn't shared with other processes. Returns None if pyarrow isn't
+    available, if the cache doesn't exist or is older than the catalog file, or
+    if the cache was made with different `pdkwargs`. If `catalog_mtime` is
+    provided, it's used as the catalog file's modification time instead of
+    stat-ing the file again.
+
+    '''
+
+    if not HAVE_PYARROW:
+        return None
+
+    cache_fpath = '%s%s' % (catalog_fpath, CATALOG_CACHE_SUFFIX)
+
+    if catalog_mtime is None:
+        catalog_mtime = os.stat(catalog_fpath).st_mtime
+
+    try:
+        if os.stat(cache_fpath).st_mtime < catalog_mtime:
+            LOGWARNING('Cached catalog %s is older than %s, ignoring it.' %
+                       (cache_fpath, catalog_fpath))
+            return None
+    except FileNotFoundError:
+        return None
+
+    table = pafeather.read_table(cache_fpath, memory_map=True)
+
+    cache_options = (table.schema.metadata or {}).get(CATALOG_CACHE_OPTIONS_KEY)
+    if cache_options != _catalog_read_options(pdkwargs):
+        LOGWARNING('Cached catalog %s was read with different options, '
+                   'ignoring it.' % cache_fpath)
+        return None
+
+    LOGINFO('Using cached catalog: %s' % cache_fpath)
+    return table.to_pandas()
+
+
+def _write_cached_catalog(catalog, catalog_fpath, pdkwargs):
+    '''This writes the parsed catalog to its Feather cache file.
+
+    The `pdkwargs` used to read the catalog are stored in the cache's schema
+    metadata, so the cache is only used for later loads with the same ones.
+
+    The cache is written uncompressed so it doesn't need to be decompressed
+    when it's read back in. It's written to a temporary file and then moved into
+    place, so a partially written cache is never read and processes that have
+    the old cache memory-mapped keep their copy.
+
+    '''
+
+    if not HAVE_PYARROW:
+        LOGWARNING('pyarrow is not available, not caching the catalog.')
+        return None
+
+    cache_fpath = '%s%s' % (catalog_fpath, CATALOG_CACHE_SUFFIX)
+    cache_tmp_fpath = '%s.tmp' % cache_fpath
+
+    try:
+        table = pa.Table.from_pandas(catalog)
+        cache_metadata = dict(table.schema.metadata or {})
+        cache_metadata[CATALOG_CACHE_OPTIONS_KEY] = (
+            _catalog_read_options(pdkwargs)
+        )
+        table = table.replace_schema_metadata(cache_metadata)
+        pafeather.write_feather(table,
+                                cache_tmp_fpath,
+                                compression='uncompressed')
+        os.replace(cache_tmp_fpath, cache_fpath)
+        LOGINFO('Wrote cached catalog: %s' % cache_fpath)
+        return cache_fpath
+    except BaseException as e:
+        try:
+            os.remove(cache_tmp_fpath)
+        except OSError:
+            pass
+        # the cache is optional, so only an interrupt is re-raised here
+        if not isinstance(e, Exception):
+            raise
+        LOGEXCEPTION('Could not write cached catalog: %s' % cache_fpath)
+        return None
+
+
+def _copy_rows(conn, table_name, columns, rows, update_columns=None):
+    '''This bulk-loads rows into a table using Postgres' COPY FROM STDIN.
+
+    `rows` is an iterable of sequences with items in the same order as
+    `columns`. Any dicts in the rows are serialized to JSON. The rows are sent
+    in batches of `COPY_CHUNK_ROWS`, so `rows` can be a generator and only one
+    batch is held in memory at a time. If `update_columns` is provided, the
+    rows are first copied into a temporary table and then inserted from there,
+    updating these columns for rows whose objectid already exists in the table.
+    If an objectid is repeated in `rows`, the last row for it is used.
+
+    This runs on the DBAPI connection underlying `conn`, so it takes part in any
+    transaction currently open on `conn`.
+
+    '''
+
+    collist = ', '.join('"%s"' % x for x in columns)
+    cursor = conn.connection.cursor()
+
+    try:
+
+        if update_columns:
+            copy_table = '%s_load' % table_name
+            cursor.execute(
+                'CREATE TEMPORARY TABLE "%s" ON COMMIT DROP AS '
+                'SELECT %s FROM "%s" WITH NO DATA' %
+                (copy_table, collist, table_name)
+            )
+        else:
+            copy_table = table_name
+
+        copy_sql = ('COPY "%s" (%s) FROM STDIN WITH (FORMAT CSV)' %
+                    (copy_table, collist))
+
+        rowbuf = io.StringIO()
+        writer = csv.writer(rowbuf)
+
+        for rowind, row in enumerate(rows, start=1):
+
+            writer.writerow(
+                [json_dumps(x) if isinstance(x, dict) else x for x in row]
+            )
+
+            if rowind % COPY_CHUNK_ROWS == 0:
+                rowbuf.seek(0)
+                cursor.copy_expert(copy_sql, rowbuf)
+                rowbuf.seek(0)
+                rowbuf.truncate()
+
+        if rowbuf.tell() > 0:
+            rowbuf.seek(0)
+            cursor.copy_expert(copy_sql, rowbuf)
+
+        # ON CONFLICT DO UPDATE can't update the same row twice in a single
+        # statement, so only the last copied row for each objectid is inserted.
+        # the temporary table is only ever appended to, so its ctids follow the
+        # order the rows were copied in.
+        if update_columns:
+            cursor.execute(
+                'INSERT INTO "%s" (%s) '
+                'SELECT DISTINCT ON (objectid) %s FROM "%s" '
+                'ORDER BY objectid, ctid DESC '
+                'ON CONFLICT (objectid) DO UPDATE SET %s' %
+                (table_name, collist, collist, copy_table,
+                 ', '.join('"%s" = excluded."%s"' % (x, x)
+                           for x in update_columns))
+            )
+            # drop the temporary table now so this can be called again in the
+            # same transaction
+            cursor.execute('DROP TABLE "%s"' % copy_table)
+
+    finally:
+        cursor.close()
+
+
+def _catalog_rows(catalog, objectids, flags_to_use, now):
+    '''This generates the object_catalog rows to load from the catalog.
+
+    `objectids` is the catalog's viz-id column as a list of ints, which the
+    caller already has for making the image file names.
+
+    The extra_columns dicts are made for `COPY_CHUNK_ROWS` catalog rows at a
+    time, so only that many of them are held in memory at once.
+
+    '''
+
+    # viz-id goes into the objectid column, so it's not repeated in the
+    # extra_columns JSONB. everything except the main columns goes in there.
+    maincol_list = ['viz-id','ra','dec']
+    othercol_list = [x for x in catalog.columns if x not in maincol_list]
+
+    # user_flags contains a JSON which tracks vote counts per flag. every object
+    # starts with the same one, so it's only serialized once. the same goes for
+    # the timestamps.
+    user_flags = json_dumps({x: 0 for x in flags_to_use})
+    now = now.isoformat()
+
+    for start in range(0, len(catalog), COPY_CHUNK_ROWS):
+
+        chunk = catalog.iloc[start:start+COPY_CHUNK_ROWS]
+
+        # Series.tolist() converts a whole column to native Python objects at
+        # once, which is much faster than to_dict(orient='records') boxing each
+        # value separately
+        othercol_values = [chunk[c].tolist() for c in othercol_list]
+
+        if othercol_values:
+            extra_columns = (dict(zip(othercol_list, x))
+                             for x in zip(*othercol_values))
+        else:
+            extra_columns = ({} for _ in range(len(chunk)))
+
+        for objectid, ra, dec, extra in zip(
+                objectids[start:start+COPY_CHUNK_ROWS],
+                chunk['ra'].tolist(),
+                chunk['dec'].tolist(),
+                extra_columns
+        ):
+            yield (objectid, ra, dec, user_flags, extra,
+                   'incomplete', now, now)
+
+
+def _image_filenames(object_imagefile_pattern, objectids):
+    '''This makes the image file name for each int in `objectids`.
+
+    Patterns of the usual 'prefix{objectid}suffix' form are filled in by
+    concatenating strings instead of running `str.format` for every object.
+
+    '''
+
+    simple_pattern = re.fullmatch(r'([^{}]*)\{objectid\}([^{}]*)',
+                                  object_imagefile_pattern)
+
+    if simple_pattern:
+        prefix, suffix = simple_pattern.groups()
+        return [prefix + str(x) + suffix for x in objectids]
+
+    return [object_imagefile_pattern.format(objectid=x) for x in objectids]
+
+
+def _ensure_indexes(conn, meta):
+    '''This creates any indexes in `meta` that are missing from the database.
+
+    `create_all` only makes the indexes of tables it creates, so this is used to
+    add the indexes introduced after the tables in an existing database were
+    made.
+
+    '''
+
+    inspector = inspect(conn)
+
+    for table in meta.sorted_tables:
+
+        existing_indexes = {
+            x['name'] for x in inspector.get_indexes(table.name)
+        }
+
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                LOGINFO('Creating missing index: %s' % index.name)
+                index.create(conn)
+
+
+def _load_catalog_chunk(conn,
+                        catalog,
+                        images_dpath,
+                        images_dlist,
+                        object_imagefile_pattern,
+                        flags_to_use,
+                        overwrite,
+                        now):
+    '''This loads the objects in a catalog DataFrame and their image paths.
+
+    `images_dlist` is the set of file names in `images_dpath` if the images are
+    in a flat local directory, or None otherwise. The inserts use COPY instead
+    of an INSERT per row. COPY doesn't fill in the SQLAlchemy-side column
+    defaults, so review_status is set explicitly here.
+
+    '''
+
+    # convert the objectids to Python ints once for all the uses below. a
+    # missing viz-id makes the column float with NaNs, so check for those first.
+    # the cast through the nullable Int64 type raises for any non-integer IDs
+    # instead of truncating them.
+    if catalog['viz-id'].isna().any():
+        raise ValueError("Some objects in the catalog don't have a viz-id.")
+    objectids = catalog['viz-id'].astype('Int64').to_numpy(
+        dtype=np.int64
+    ).tolist()
+
+    LOGINFO("Inserting object rows...")
+
+    _copy_rows(
+        conn,
+        'object_catalog',
+        ('objectid', 'ra', 'dec', 'user_flags', 'extra_columns',
+         'review_status', 'added', 'updated'),
+        _catalog_rows(catalog, objectids, flags_to_use, now),
+        update_columns=(
+            ('updated', 'user_flags', 'extra_columns', 'ra', 'dec')
+            if overwrite else None
+        )
+    )
+
+    LOGINFO("Inserting object image file paths...")
+
+    image_files = _image_filenames(object_imagefile_pattern, objectids)
+
+    if images_dpath.startswith(REMOTE_IMAGE_PREFIXES):
+
+        images_url = images_dpath.rstrip('/') + '/'
+        object_images = [images_url + x for x in image_files]
+
+    # if the image file pattern includes a subdirectory, the files won't be in a
+    # listing of images_dpath, so check for each file directly. stat releases
+    # the GIL, so a few threads can overlap the latency of these checks on
+    # network filesystems.
+    elif images_dlist is None:
+
+        image_fpaths = [
+            os.path.abspath(os.path.join(images_dpath, x))
+            for x in image_files
+        ]
+        with ThreadPoolExecutor(max_workers=IMAGE_CHECK_THREADS) as executor:
+            image_exists = executor.map(os.path.exists, image_fpaths)
+            object_images = [
+                x if y else None
+                for x, y in zip(image_fpaths, image_exists)
+            ]
+
+    # images_dpath is already absolute, so the paths can be joined directly
+    else:
+
+        object_images = [
+            os.path.join(images_dpath, x) if x in images_dlist else None
+            for x in image_files
+        ]
+
+    # insert the object image rows
+    _copy_rows(
+        conn,
+        'object_images',
+        ('objectid', 'filepath', 'added', 'updated'),
+        ((x, y, now, now)
+         for x, y in zip(objectids, object_images)),
+        update_columns=(
+            ('updated', 'filepath') if overwrite else None
+        )
+    )
+
 
 def load_catalog(catalog_fpath,
                  images_dpath,
@@ -88,6 +875,10 @@ def load_catalog(catalog_fpath,
                  dbkwargs=None,
                  object_imagefile_pattern='hugs-{objectid}.png',
                  flags_to_use=DEFAULT_FLAGS,
+                 cache_catalog=False,
+                 columns=None,
+                 dtype_map=None,
+                 chunksize=None,
                  **pdkwargs):
     '''This loads the catalog into the vizinspect database object_catalog table.
 
@@ -95,7 +886,10 @@ def load_catalog(catalog_fpath,
     ----------
 
     catalog_fpath : str
-        The path to the CSV to load.
+        The path to the CSV to load. If this ends in '.parquet' or '.feather',
+        it will be read as a Parquet or Feather file instead. See
+        `convert_catalog_to_parquet` to make a Parquet file from a CSV. A
+        ValueError is raised if this file is empty.
 
     images_dpath : str
         The path to the images directory. If this starts with 'dos://', this
@@ -111,7 +905,7 @@ def load_catalog(catalog_fpath,
         - the database URL or the connection instance to use
         - the database metadata object
 
-        If the database URL is provided, a new engine will be used. If the
+        If the database URL is provided, a pooled engine will be used. If the
         connection itself is provided, it will be re-used.
 
     overwrite : bool
@@ -130,8 +924,38 @@ def load_catalog(catalog_fpath,
         These are the flag column names to add into the catalog when loading it
         for the first time.
 
+    cache_catalog : bool
+        If True, the parsed catalog will be written to a Feather file next to
+        `catalog_fpath` (with '.cached.feather' appended to its name) and
+        memory-mapped from there on subsequent loads, as long as it's newer
+        than `catalog_fpath` and was made with the same `columns`,
+        `dtype_map`, and `pdkwargs`. Otherwise, the catalog is read again and
+        the cache is replaced.
+
+    columns : sequence of str or None
+        If provided, only these columns will be read from the catalog. The 'ra',
+        'dec', and 'viz-id' columns are always read. Leaving out unused columns
+        makes reading large catalogs faster and uses less memory.
+
+    dtype_map : dict or None
+        If provided, this is a dict of column name -> dtype to use when reading
+        the catalog. See `FLOAT32_DTYPE_MAP` for a map that reads the magnitude
+        and extinction columns as float32.
+
+    chunksize : int or None
+        If provided, a CSV catalog will be read and loaded this many rows at a
+        time using `pandas.read_csv` instead of all at once, so memory use
+        stays bounded for large catalogs. All chunks are loaded in the same
+        transaction. This is ignored if `cache_catalog` is True or the catalog
+        is a Parquet or Feather file.
+
     pdkwargs : extra keyword arguments
-        All of these will passed directly to the `pandas.read_csv` function.
+        All of these will passed directly to the `pandas.read_csv` function. If
+        pyarrow is installed and only `usecols`, `na_values`, and `dtype` are
+        provided, the faster `pyarrow.csv.read_csv` function will be used
+        instead. This needs `dtype` to be a dict of column names to numpy types;
+        pandas extension types like 'category' or 'Int64' are read by pandas.
+        Only `usecols` and `dtype` are used for Parquet and Feather files.
 
     Returns
     -------
@@ -141,168 +965,351 @@ def load_catalog(catalog_fpath,
 
     '''
 
-    # read the catalog
-    catalog = pd.read_csv(catalog_fpath, **pdkwargs)
+    # check the catalog file before handing it to any of the readers. this
+    # raises FileNotFoundError if it doesn't exist.
+    catalog_stat = os.stat(catalog_fpath)
+    if catalog_stat.st_size == 0:
+        raise ValueError('catalog file: %s is empty' % catalog_fpath)
+
+    if columns is not None:
+        pdkwargs['usecols'] = list(columns) + [
+            x for x in REQUIRED_COLUMNS if x not in columns
+        ]
+    if dtype_map is not None:
+        pdkwargs['dtype'] = dtype_map
+
+    # read the catalog, using its cached copy if that's up to date and was read
+    # with the same options
+    catalog = None
+    if cache_catalog:
+        catalog = _read_cached_catalog(catalog_fpath,
+                                       pdkwargs,
+                                       catalog_mtime=catalog_stat.st_mtime)
+
+    if catalog is None:
+
+        catalog_ext = os.path.splitext(catalog_fpath)[-1].lower()
+
+        # stream the CSV in chunks if we can. the whole catalog is needed to
+        # write the cache and Parquet/Feather files are read in one go anyway.
+        if (chunksize is not None and
+            not cache_catalog and
+            catalog_ext not in ('.parquet', '.feather')):
+
+            catalog_chunks = _read_catalog_chunks(catalog_fpath,
+                                                  chunksize,
+                                                  **pdkwargs)
+
+        else:
+
+            catalog = _read_catalog(catalog_fpath, **pdkwargs)
+            _add_catalog_colors(catalog)
+
+            if cache_catalog:
+                _write_cached_catalog(catalog, catalog_fpath, pdkwargs)
+
+            catalog_chunks = (catalog,)
 
-    #
-    # get the database
-    #
-    dbref, dbmeta = dbinfo
-    if not dbkwargs:
-        dbkwargs = {}
-    if isinstance(dbref, str) and 'postgres' in dbref:
-        if not dbkwargs:
-            dbkwargs = {'engine_kwargs':{'json_serializer':json_dumps}}
-        elif dbkwargs and 'engine_kwargs' not in dbkwargs:
-            dbkwargs['engine_kwargs'] = {'json_serializer':json_dumps}
-        elif dbkwargs and 'engine_kwargs' in dbkwargs:
-            dbkwargs['engine_kwargs'].update({'json_serializer':json_dumps})
-        engine, conn, meta = get_postgres_db(dbref,
-                                             dbmeta,
-                                             **dbkwargs)
-    elif isinstance(dbref, str) and 'postgres' not in dbref:
-        raise NotImplementedError(
-            "viz-inspect currently doesn't support non-Postgres databases."
-        )
     else:
-        engine, conn, meta = None, dbref, dbmeta
-        meta.bind = conn
-    #
-    # end of database get
-    #
+        catalog_chunks = (catalog,)
+
+    # here, if the images are all remote, then we don't check if they exist
+    # locally. the server frontend will take care of getting them later.
+    # otherwise, if they're in a flat local directory, list that once and look
+    # up the images for each object in that instead of checking for each file
+    # separately.
+    images_dlist = None
+    if not images_dpath.startswith(REMOTE_IMAGE_PREFIXES):
+
+        images_dpath = os.path.abspath(images_dpath)
+
+        if not os.path.dirname(object_imagefile_pattern):
+            # if the image directory is missing, the objects get NULL image
+            # filepaths instead of failing the load
+            try:
+                with os.scandir(images_dpath) as images_dir:
+                    images_dlist = {x.name for x in images_dir if x.is_file()}
+            except (FileNotFoundError, NotADirectoryError):
+                LOGWARNING('Image directory %s does not exist, '
+                           'no object images will be found.' % images_dpath)
+                images_dlist = set()
+
+    with _dbconn(dbinfo, dbkwargs) as (conn, meta):
+
+        now = datetime.now(tz=utc)
+        nobjects = 0
+
+        # all of the chunks are loaded in a single transaction, so a failure
+        # partway through leaves the tables untouched
+        with conn.begin():
+
+            for catalog in catalog_chunks:
+
+                _load_catalog_chunk(conn,
+                                    catalog,
+                                    images_dpath,
+                                    images_dlist,
+                                    object_imagefile_pattern,
+                                    flags_to_use,
+                                    overwrite,
+                                    now)
+                nobjects += len(catalog)
+
+            # add any indexes that this database doesn't have yet. these are
+            # built after the load so they don't slow the COPYs down.
+            _ensure_indexes(conn, meta)
+
+    # the image file paths may have changed, so drop any cached ones in this
+    # process. other processes will notice the change on their next generation
+    # check in get_object_image_filepath.
+    _OBJECT_IMAGE_FILEPATHS.clear()
+    _OBJECT_IMAGE_CACHE_STATE['checked'] = None
 
-    # get the columns out of the catalog
-    column_list = list(catalog.columns)
-    maincol_list = ['ra','dec']
-    othercol_list = list(set(column_list) - set(maincol_list))
+    # if we make it to here, the insert was successful
+    LOGINFO('Inserted %s new objects.' % nobjects)
+    return True
 
-    # the main columns
-    main_cols = catalog[maincol_list].to_dict(orient='records')
-    other_cols = catalog[othercol_list].to_dict(orient='records')
 
-    now = datetime.now(tz=utc)
+########################################
+## GETTING OBJECTS OUT OF THE CATALOG ##
+########################################
+
+# this caches the image file paths for the most recently requested objects in
+# each process. it's bounded so large catalogs aren't copied into every server
+# worker.
+OBJECT_IMAGE_CACHE_SIZE = 4096
+_OBJECT_IMAGE_FILEPATHS = LRUCache(OBJECT_IMAGE_CACHE_SIZE)
+
+# catalogs may be loaded by a different process than the one serving images, so
+# each process checks the object_images table for changes every this many
+# seconds and drops its cached image file paths if there were any. the
+# generation is the max imageid and updated time, which are both indexed.
+OBJECT_IMAGE_CACHE_CHECK_SECONDS = 30.0
+_OBJECT_IMAGE_CACHE_STATE = {'generation':None, 'checked':None}
+
+# this marks objects that aren't in the image file path cache, since None is a
+# valid cached value for objects without images
+_NOT_CACHED = object()
 
-    for x,y in zip(main_cols, other_cols):
+# this caches the compiled SQL for the statements used by get_object and
+# get_objects. these statements are only built once per query shape, so this
+# only ever holds a few of them, but it's bounded in case that changes.
+_COMPILED_STATEMENTS = LRUCache(256)
 
-        x['extra_columns'] = y
-        x['added'] = now
-        x['updated'] = now
-        x['objectid'] = y['viz-id']
 
-        # this column now contains a JSON which tracks vote counts per flag
-        x['user_flags'] = {x: 0 for x in flags_to_use}
+@lru_cache(maxsize=None)
+def _get_object_select(meta):
+    '''This builds the select statements used by `get_object`.
+
+    These are built once and reused. The objectid to get is bound when the
+    statements are executed using the `objectid` parameter.
+
+    Returns a tuple of the statement that gets the object's catalog row and the
+    statement that gets its comments, newest first. The comments are fetched
+    separately so Postgres can read them in order straight off the
+    (objectid, added DESC) index instead of sorting a join.
+
+    '''
 
-    # get the table
     object_catalog = meta.tables['object_catalog']
+    object_comments = meta.tables['object_comments']
 
-    # execute the inserts
-    with conn.begin():
+    object_sel = select(
+        [object_catalog.c.id.label('keyid'),
+         object_catalog.c.objectid,
+         object_catalog.c.ra,
+         object_catalog.c.dec,
+         object_catalog.c.user_flags,
+         object_catalog.c.extra_columns,
+         object_catalog.c.review_status]
+    ).where(
+        object_catalog.c.objectid == bindparam('objectid')
+    )
 
-        LOGINFO("Inserting object rows...")
+    comments_sel = select(
+        [object_comments.c.added.label("comment_added_on"),
+         object_comments.c.userid.label("comment_by_userid"),
+         object_comments.c.username.label("comment_by_username"),
+         object_comments.c.user_flags.label("comment_userset_flags"),
+         object_comments.c.contents.label("comment_text")]
+    ).where(
+        object_comments.c.objectid == bindparam('objectid')
+    ).order_by(
+        object_comments.c.added.desc()
+    )
 
-        for row in tqdm(main_cols):
+    return object_sel, comments_sel
 
-            # prepare the insert
-            insert = pg.insert(
-                object_catalog
-            ).values(
-                row
-            )
 
-            if overwrite:
-                insert = insert.on_conflict_do_update(
-                    index_elements=[object_catalog.c.objectid],
-                    set_={'updated':now,
-                          'user_flags':row['user_flags'],
-                          'extra_columns':row['extra_columns'],
-                          'ra':row['ra'],
-                          'dec':row['dec']}
-                )
+@lru_cache(maxsize=256)
+def _get_objects_select(meta, getinfo, filter_review_status, userid_mode,
+                        page_mode, sampled):
+    '''This builds the select statement used by `get_objects`.
 
-            # insert the object rows
-            conn.execute(insert)
+    The statement only depends on the shape of the query, so it's built once
+    for each combination of these arguments and then reused.
+    `filter_review_status` is a bool indicating if the objects are filtered on
+    their review status.
+    `page_mode` is a tuple of bools indicating if start_keyid, end_keyid, and
+    max_objects are provided. The values to filter on are bound when the
+    statement is executed using the `review_status`, `userid`, `start_keyid`,
+    `end_keyid`, `max_objects`, and `sample_percent` parameters.
 
-        LOGINFO("Inserting object image file paths...")
+    Returns a tuple of the statement and a bool indicating if its rows are in
+    reverse keyid order.
 
-        # here, if the images are all remote, then we don't check if they exist
-        # locally. the server frontend will take care of getting them later.
-        if (images_dpath.startswith('dos://') or
-            images_dpath.startswith('s3://')):
+    '''
 
-            object_images = [
-                '%s/%s' % (
-                    images_dpath.rstrip('/'),
-                    object_imagefile_pattern.format(
-                        objectid=int(x['objectid'])
-                    )
-                ) for x in main_cols
-            ]
+    # prepare the select
+    object_catalog = meta.tables['object_catalog']
+    object_comments = meta.tables['object_comments']
 
-        # otherwise, the images are in a local directory
-        else:
+    # add in the random sample if specified
+    if sampled:
+        object_catalog_sample = object_catalog.tablesample(
+            func.bernoulli(bindparam('sample_percent'))
+        )
+    else:
+        object_catalog_sample = object_catalog
 
-            # look up the images for each object
-            object_images = [
-                os.path.join(
-                    images_dpath,
-                    object_imagefile_pattern.format(
-                        objectid=int(x['objectid'])
-                    )
-                ) for x in main_cols
-            ]
+    # only the full info needs the comment columns. the count and objectid
+    # selects are made directly from the catalog, so there's one row per object
+    # and no DISTINCT needed. any filtering on comments is done with
+    # (NOT) EXISTS semi-joins below.
+    join = object_catalog_sample.outerjoin(object_comments)
 
-            object_images = [
-                (os.path.abspath(x) if os.path.exists(x) else None)
-                for x in object_images
-            ]
+    # this matches comments by the user on each object being selected. it uses
+    # its own alias of object_comments so it still has a FROM when the outer
+    # select joins object_comments too (getinfo='all'); otherwise both tables
+    # would be correlated out of the subquery.
+    user_comments = object_comments.alias('user_comments')
+    user_commented = exists().where(
+        user_comments.c.objectid == object_catalog_sample.c.objectid
+    ).where(
+        user_comments.c.userid == bindparam('userid')
+    )
 
-        # generate the object insertion rows
-        image_cols = [
-            {'objectid':x,
-             'added':now,
-             'updated':now,
-             'filepath':y}
-            for x,y in zip([a['objectid'] for a in main_cols], object_images)
-        ]
+    if getinfo == 'all':
 
-        # get the table
-        object_images = meta.tables['object_images']
+        sel = select([
+            object_catalog_sample.c.id.label('keyid'),
+            object_catalog_sample.c.objectid,
+            object_catalog_sample.c.ra,
+            object_catalog_sample.c.dec,
+            object_catalog_sample.c.extra_columns,
+            object_comments.c.added.label("comment_added_on"),
+            object_comments.c.userid.label("comment_by_userid"),
+            object_comments.c.username.label("comment_by_username"),
+            object_comments.c.contents.label("comment_text"),
+            object_comments.c.user_flags.label("comment_userset_flags"),
+            object_catalog_sample.c.user_flags,
+            object_catalog_sample.c.review_status
+        ]).select_from(
+            join
+        )
+
+    elif getinfo == 'count':
+
+        sel = select(
+            [func.count(object_catalog_sample.c.id)]
+        ).select_from(object_catalog_sample)
+
+    else:
+        sel = select([
+            object_catalog_sample.c.id,
+            object_catalog_sample.c.objectid,
+        ]).select_from(object_catalog_sample)
+
+    #
+    # get the actual selection on the review_status kwarg
+    #
+
+    if filter_review_status:
+        actual_sel = sel.where(
+            object_catalog_sample.c.review_status == bindparam('review_status')
+        )
+    else:
+        actual_sel = sel
 
-        for row in tqdm(image_cols):
+    #
+    # add the user id handling
+    #
+
+    if userid_mode is not None:
 
-            # prepare the insert
-            insert = pg.insert(
-                object_images
-            ).values(
-                row
+        if userid_mode == 'include' and getinfo == 'all':
+            # only return this user's comment rows
+            actual_sel = actual_sel.where(
+                (object_comments.c.userid == bindparam('userid'))
             )
+        elif userid_mode == 'include':
+            actual_sel = actual_sel.where(user_commented)
+        else:
+            # this excludes all the objects that this user has voted on but
+            # includes all objects that have no reviews
+            actual_sel = actual_sel.where(~user_commented)
 
-            if overwrite:
-                insert = insert.on_conflict_do_update(
-                    index_elements=[object_images.c.objectid],
-                    set_={
-                        'updated':now,
-                        'filepath':row['filepath']
-                    }
-                )
+    #
+    # add in the pagination
+    #
 
-            conn.execute(insert)
+    has_start_keyid, has_end_keyid, has_max_objects = page_mode
 
-    # close everything down if we were passed a database URL only and had to
-    # make a new engine
-    if engine:
-        conn.close()
-        meta.bind = None
-        engine.dispose()
+    # if only start_keyid is provided
+    if (has_start_keyid and
+        not has_end_keyid and
+        has_max_objects):
+        paged_sel = actual_sel.where(
+            object_catalog_sample.c.id >= bindparam('start_keyid')
+        ).order_by(
+            object_catalog_sample.c.id
+        ).limit(bindparam('max_objects'))
+        revorder = False
 
-    # if we make it to here, the insert was successful
-    LOGINFO('Inserted %s new objects.' % len(catalog))
-    return True
+    elif (has_start_keyid and
+          not has_end_keyid and
+          not has_max_objects):
+        paged_sel = actual_sel.where(
+            object_catalog_sample.c.id >= bindparam('start_keyid')
+        ).order_by(object_catalog_sample.c.id)
+        revorder = False
 
+    # if only end_keyid is provided
+    elif (not has_start_keyid and
+          has_end_keyid and
+          has_max_objects):
+        paged_sel = actual_sel.where(
+            object_catalog_sample.c.id <= bindparam('end_keyid')
+        ).order_by(
+            object_catalog_sample.c.id.desc()
+        ).limit(bindparam('max_objects'))
+        revorder = True
+
+    elif (not has_start_keyid and
+          has_end_keyid and
+          not has_max_objects):
+        paged_sel = actual_sel.where(
+            object_catalog_sample.c.id <= bindparam('end_keyid')
+        ).order_by(object_catalog_sample.c.id.desc())
+        revorder = True
+
+    # if both are provided
+    elif (has_start_keyid and
+          has_end_keyid):
+        paged_sel = actual_sel.where(
+            object_catalog_sample.c.id >= bindparam('start_keyid')
+        ).where(
+            object_catalog_sample.c.id <= bindparam('end_keyid')
+        ).order_by(object_catalog_sample.c.id)
+        revorder = False
+
+    # everything else has no pagination
+    else:
+        paged_sel = actual_sel
+        revorder = False
+
+    return paged_sel, revorder
 
-########################################
-## GETTING OBJECTS OUT OF THE CATALOG ##
-########################################
 
 def get_object(objectid,
                dbinfo,
@@ -322,7 +1329,7 @@ def get_object(objectid,
         - the database URL or the connection instance to use
         - the database metadata object
 
-        If the database URL is provided, a new engine will be used. If the
+        If the database URL is provided, a pooled engine will be used. If the
         connection itself is provided, it will be re-used.
 
     dbkwargs : dict or None
@@ -331,96 +1338,217 @@ def get_object(objectid,
     Returns
     -------
 
-    dict
-        Returns all of the object's info as a dict.
+    list of dicts
+        Returns one dict per comment on the object, newest first. Each dict has
+        the object's catalog info and the comment's info in the `comment_*`
+        keys. If the object has no comments, a single dict is returned with the
+        `comment_*` keys set to None. If the object doesn't exist, this is an
+        empty list.
 
     '''
 
-    #
-    # get the database
-    #
-    dbref, dbmeta = dbinfo
-    if not dbkwargs:
-        dbkwargs = {}
-    if isinstance(dbref, str) and 'postgres' in dbref:
-        if not dbkwargs:
-            dbkwargs = {'engine_kwargs':{'json_serializer':json_dumps}}
-        elif dbkwargs and 'engine_kwargs' not in dbkwargs:
-            dbkwargs['engine_kwargs'] = {'json_serializer':json_dumps}
-        elif dbkwargs and 'engine_kwargs' in dbkwargs:
-            dbkwargs['engine_kwargs'].update({'json_serializer':json_dumps})
-        engine, conn, meta = get_postgres_db(dbref,
-                                             dbmeta,
-                                             **dbkwargs)
-    elif isinstance(dbref, str) and 'postgres' not in dbref:
-        raise NotImplementedError(
-            "PIPE-TrEx currently doesn't support non-Postgres databases."
-        )
+    with _dbconn(dbinfo, dbkwargs) as (conn, meta):
+
+        object_sel, comments_sel = _get_object_select(meta)
+
+        with conn.begin():
+
+            cached_conn = conn.execution_options(
+                compiled_cache=_COMPILED_STATEMENTS
+            )
+
+            res = cached_conn.execute(object_sel, objectid=objectid)
+            object_row = res.fetchone()
+            res.close()
+
+            # don't bother with the comments if there's no such object
+            if object_row is None:
+                return []
+
+            object_row = dict(object_row)
+
+            res = cached_conn.execute(comments_sel, objectid=objectid)
+            comment_rows = [dict(row) for row in res]
+
+    if len(comment_rows) == 0:
+        comment_rows = [{'comment_added_on':None,
+                         'comment_by_userid':None,
+                         'comment_by_username':None,
+                         'comment_userset_flags':None,
+                         'comment_text':None}]
+
+    rows = [dict(object_row, **x) for x in comment_rows]
+    return rows
+
+
+def _normalize_objects_query(review_status, getinfo, userid_check):
+    '''This normalizes the query options for `get_objects` and `iter_objects`.
+
+    Equivalent options are mapped to the same values so these queries share a
+    statement. Returns a tuple of the review_status, getinfo, the userid to
+    check, and 'include' or 'exclude' (or None if there's no userid check).
+
+    '''
+
+    if review_status not in ('complete-good', 'complete-bad', 'incomplete'):
+        review_status = 'all'
+    if getinfo not in ('all', 'count'):
+        getinfo = 'objectids'
+
+    if userid_check is not None:
+        userid_to_check, include_or_exclude = userid_check
+        if include_or_exclude != 'include':
+            include_or_exclude = 'exclude'
     else:
-        engine, conn, meta = None, dbref, dbmeta
-        meta.bind = conn
-    #
-    # end of database get
-    #
+        userid_to_check, include_or_exclude = None, None
 
-    # prepare the select
-    object_catalog = meta.tables['object_catalog']
-    object_comments = meta.tables['object_comments']
+    return review_status, getinfo, userid_to_check, include_or_exclude
 
-    join = object_catalog.outerjoin(
-        object_comments
-    )
 
-    sel = select(
-        [object_catalog.c.id.label('keyid'),
-         object_catalog.c.objectid,
-         object_catalog.c.ra,
-         object_catalog.c.dec,
-         object_catalog.c.user_flags,
-         object_catalog.c.extra_columns,
-         object_catalog.c.review_status,
-         object_comments.c.added.label("comment_added_on"),
-         object_comments.c.userid.label("comment_by_userid"),
-         object_comments.c.username.label("comment_by_username"),
-         object_comments.c.user_flags.label("comment_userset_flags"),
-         object_comments.c.contents.label("comment_text")]
-    ).select_from(
-        join
-    ).where(
-        object_catalog.c.objectid == objectid
-    ).order_by(
-        object_comments.c.added.desc()
+def get_objects(
+        dbinfo,
+        userid_check=None,
+        review_status='all',
+        start_keyid=1,
+        end_keyid=None,
+        max_objects=50,
+        getinfo='objectids',
+        dbkwargs=None,
+        fast_fetch=False,
+        random_sample_percent=None,
+):
+    '''This is used to get object lists filtering on either userids or review
+    status or both.
+
+    Parameters
+    ----------
+
+    dbinfo : tuple
+        This is a tuple of two items:
+
+        - the database URL or the connection instance to use
+        - the database metadata object
+
+        If the database URL is provided, a pooled engine will be used. If the
+        connection itself is provided, it will be re-used.
+
+    userid_check : tuple
+        This is of the form: (userid_to_check, include_or_exclude) where
+        userid_to_check is the integer user ID of the user to check and
+        include_or_exclude is a string from {'include', 'exclude'}.
+
+    review_status : str
+        This is a string that indicates what kinds of objects to return.
+
+        Choose from:
+
+        - 'all' -> all objects
+        - 'complete-good' -> objects that have at least 2 'good' votes
+        - 'complete-bad' -> objects that have at least 2 'bad' votes
+        - 'incomplete' -> objects that don't have at least 2 votes either way
+
+    getinfo: {'objectids','all', 'count'}
+        If 'objectids', returns only the objectids matching the specified
+        criteria. If 'all', returns all info per object.
+
+    dbkwargs : dict or None
+        A dict of kwargs to pass to the database open function.
+
+    fast_fetch : bool
+        If True, returns bare tuples instead of nice dicts per row. This is much
+        faster but not as convenient.
+
+    random_sample_percent: float or None
+        If this is provided, will be used to push the random sampling into the
+        Postgres database itself. This must be a float between 0.0 and 100.0
+        indicating the percentage of rows to sample.
+
+    Returns
+    -------
+
+    dict
+        Returns all of the object's info as a dict.
+
+    '''
+
+    review_status, getinfo, userid_to_check, include_or_exclude = (
+        _normalize_objects_query(review_status, getinfo, userid_check)
     )
 
-    with conn.begin():
+    with _dbconn(dbinfo, dbkwargs) as (conn, meta):
+
+        paged_sel, revorder = _get_objects_select(
+            meta,
+            getinfo,
+            review_status != 'all',
+            include_or_exclude,
+            (start_keyid is not None,
+             end_keyid is not None,
+             max_objects is not None),
+            random_sample_percent is not None
+        )
 
-        res = conn.execute(sel)
-        rows = [{column: value for column, value in row.items()} for row in res]
+        with conn.begin():
+
+            res = conn.execution_options(
+                compiled_cache=_COMPILED_STATEMENTS
+            ).execute(
+                paged_sel,
+                review_status=review_status,
+                userid=userid_to_check,
+                start_keyid=start_keyid,
+                end_keyid=end_keyid,
+                max_objects=max_objects,
+                sample_percent=random_sample_percent
+            )
+            if fast_fetch:
+                rows = res.fetchall()
+                if len(rows) > 0:
+                    if not revorder:
+                        ret_start_keyid = rows[0][0]
+                        ret_end_keyid = rows[-1][0]
+                    else:
+                        ret_start_keyid = rows[-1][0]
+                        ret_end_keyid = rows[0][0]
 
-    # close everything down if we were passed a database URL only and had to
-    # make a new engine
-    if engine:
-        conn.close()
-        meta.bind = None
-        engine.dispose()
+                else:
+                    ret_start_keyid = 1
+                    ret_end_keyid = 1
+            else:
+                rows = [dict(row) for row in res]
+                if len(rows) > 0:
+                    if not revorder:
+                        ret_start_keyid = rows[0]['keyid']
+                        ret_end_keyid = rows[-1]['keyid']
+                    else:
+                        ret_start_keyid = rows[-1]['keyid']
+                        ret_end_keyid = rows[0]['keyid']
 
-    return rows
+                else:
+                    ret_start_keyid = 1
+                    ret_end_keyid = 1
 
+    return rows, ret_start_keyid, ret_end_keyid, revorder
 
-def get_objects(
+
+def iter_objects(
         dbinfo,
         userid_check=None,
         review_status='all',
         start_keyid=1,
         end_keyid=None,
-        max_objects=50,
-        getinfo='objectids',
+        getinfo='all',
         dbkwargs=None,
-        fast_fetch=False,
         random_sample_percent=None,
+        batch_size=1000,
 ):
-    '''This is used to get object lists filtering on either userids or review
-    status or both.
+    '''This iterates over objects filtering on either userids or review status
+    or both.
+
+    This is like `get_objects` without a `max_objects` limit, except that the
+    rows are streamed from a server-side cursor `batch_size` at a time instead
+    of all being read into memory at once. Use this for large listings and
+    exports.
 
     Parameters
     ----------
@@ -431,7 +1559,7 @@ def get_objects(
         - the database URL or the connection instance to use
         - the database metadata object
 
-        If the database URL is provided, a new engine will be used. If the
+        If the database URL is provided, a pooled engine will be used. If the
         connection itself is provided, it will be re-used.
 
     userid_check : tuple
@@ -440,255 +1568,166 @@ def get_objects(
         include_or_exclude is a string from {'include', 'exclude'}.
 
     review_status : str
-        This is a string that indicates what kinds of objects to return.
+        This is a string that indicates what kinds of objects to return. See
+        `get_objects` for the options.
 
-        Choose from:
+    start_keyid : int or None
+        If provided, only objects with this keyid or later are returned.
 
-        - 'all' -> all objects
-        - 'complete-good' -> objects that have at least 2 'good' votes
-        - 'complete-bad' -> objects that have at least 2 'bad' votes
-        - 'incomplete' -> objects that don't have at least 2 votes either way
+    end_keyid : int or None
+        If provided, only objects with this keyid or earlier are returned.
 
-    getinfo: {'objectids','all', 'count'}
+    getinfo: {'objectids','all'}
         If 'objectids', returns only the objectids matching the specified
         criteria. If 'all', returns all info per object.
 
     dbkwargs : dict or None
         A dict of kwargs to pass to the database open function.
 
-    fast_fetch : bool
-        If True, returns bare tuples instead of nice dicts per row. This is much
-        faster but not as convenient.
-
     random_sample_percent: float or None
         If this is provided, will be used to push the random sampling into the
         Postgres database itself. This must be a float between 0.0 and 100.0
         indicating the percentage of rows to sample.
 
+    batch_size : int
+        The number of rows to fetch from the database at a time.
+
     Returns
     -------
 
-    dict
-        Returns all of the object's info as a dict.
+    generator
+        This yields a dict for each row. The database connection is held until
+        the generator is exhausted or closed.
 
     '''
 
-    #
-    # get the database
-    #
-    dbref, dbmeta = dbinfo
-    if not dbkwargs:
-        dbkwargs = {}
-    if isinstance(dbref, str) and 'postgres' in dbref:
-        if not dbkwargs:
-            dbkwargs = {'engine_kwargs':{'json_serializer':json_dumps}}
-        elif dbkwargs and 'engine_kwargs' not in dbkwargs:
-            dbkwargs['engine_kwargs'] = {'json_serializer':json_dumps}
-        elif dbkwargs and 'engine_kwargs' in dbkwargs:
-            dbkwargs['engine_kwargs'].update({'json_serializer':json_dumps})
-        engine, conn, meta = get_postgres_db(dbref,
-                                             dbmeta,
-                                             **dbkwargs)
-    elif isinstance(dbref, str) and 'postgres' not in dbref:
-        raise NotImplementedError(
-            "viz-inspect currently doesn't support non-Postgres databases."
+    review_status, getinfo, userid_to_check, include_or_exclude = (
+        _normalize_objects_query(review_status, getinfo, userid_check)
+    )
+
+    with _dbconn(dbinfo, dbkwargs) as (conn, meta):
+
+        paged_sel, _ = _get_objects_select(
+            meta,
+            getinfo,
+            review_status != 'all',
+            include_or_exclude,
+            (start_keyid is not None,
+             end_keyid is not None,
+             False),
+            random_sample_percent is not None
         )
-    else:
-        engine, conn, meta = None, dbref, dbmeta
-        meta.bind = conn
-    #
-    # end of database get
-    #
 
-    # prepare the select
-    object_catalog = meta.tables['object_catalog']
-    object_comments = meta.tables['object_comments']
+        with conn.begin():
+
+            res = conn.execution_options(
+                compiled_cache=_COMPILED_STATEMENTS,
+                stream_results=True
+            ).execute(
+                paged_sel,
+                review_status=review_status,
+                userid=userid_to_check,
+                start_keyid=start_keyid,
+                end_keyid=end_keyid,
+                sample_percent=random_sample_percent
+            )
 
-    # add in the random sample if specified
-    if random_sample_percent is not None:
-        object_catalog_sample = object_catalog.tablesample(
-            func.bernoulli(random_sample_percent)
-        )
-    else:
-        object_catalog_sample = object_catalog
+            try:
+                while True:
+                    rows = res.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield dict(row)
+            finally:
+                res.close()
 
-    join = object_catalog_sample.outerjoin(object_comments)
 
-    if getinfo == 'all':
+def get_object_image_filepath(objectid,
+                              dbinfo,
+                              dbkwargs=None):
+    '''This gets the image file path for a single object.
 
-        sel = select([
-            object_catalog_sample.c.id.label('keyid'),
-            object_catalog_sample.c.objectid,
-            object_catalog_sample.c.ra,
-            object_catalog_sample.c.dec,
-            object_catalog_sample.c.extra_columns,
-            object_comments.c.added.label("comment_added_on"),
-            object_comments.c.userid.label("comment_by_userid"),
-            object_comments.c.username.label("comment_by_username"),
-            object_comments.c.contents.label("comment_text"),
-            object_comments.c.user_flags.label("comment_userset_flags"),
-            object_catalog_sample.c.user_flags,
-            object_catalog_sample.c.review_status
-        ]).select_from(
-            join
-        )
+    Image file paths are cached for the most recently requested objects. The
+    cache is dropped if the object_images table has changed, which is checked
+    at most every `OBJECT_IMAGE_CACHE_CHECK_SECONDS`, so a catalog loaded by
+    another process will show up here after that long.
 
-    elif getinfo == 'count':
+    Parameters
+    ----------
 
-        sel = select(
-            [func.count(distinct(object_catalog_sample.c.id))]
-        ).select_from(join).distinct()
+    objectid : int
+        The object ID for the object to get the image file path for.
 
-    else:
-        sel = select([
-            object_catalog_sample.c.id,
-            object_catalog_sample.c.objectid,
-        ]).select_from(join).distinct()
+    dbinfo : tuple
+        This is a tuple of two items:
 
-    #
-    # get the actual selection on the review_status kwarg
-    #
+        - the database URL or the connection instance to use
+        - the database metadata object
 
-    if review_status == 'complete-good':
-        actual_sel = sel.where(
-            object_catalog_sample.c.review_status == 'complete-good'
-        )
-    elif review_status == 'complete-bad':
-        actual_sel = sel.where(
-            object_catalog_sample.c.review_status == 'complete-bad'
-        )
-    elif review_status == 'incomplete':
-        actual_sel = sel.where(
-            object_catalog_sample.c.review_status == 'incomplete'
-        )
-    else:
-        actual_sel = sel
+        If the database URL is provided, a pooled engine will be used. If the
+        connection itself is provided, it will be re-used.
 
-    #
-    # add the user id handling
-    #
+    dbkwargs : dict or None
+        A dict of kwargs to pass to the database open function.
 
-    if userid_check is not None:
+    Returns
+    -------
 
-        userid_to_check, include_or_exclude = userid_check
+    str or None
+        The image file path or URL for the object. This is None if the object
+        has no image.
 
-        if include_or_exclude == 'include':
-            actual_sel = actual_sel.where(
-                (object_comments.c.userid == userid_to_check)
-            )
-        else:
-            # actual_sel = actual_sel.where(
-            #     ( or_(object_comments.c.userid.is_(None),
-            #           (object_comments.c.userid != userid_to_check)) )
-            # )
-
-            # this selects all the objectids that this user has voted on
-            subquery_sel = select(
-                [object_catalog_sample.c.objectid]
-            ).select_from(join).where(
-                object_comments.c.userid == userid_to_check
-            ).alias()
-
-            # the actual select then excludes these objects but includes
-            # all objects that have no reviews
-            actual_sel = actual_sel.where(
-                (or_(object_catalog_sample.c.objectid.notin_(subquery_sel),
-                     object_comments.c.userid.is_(None)))
-            )
+    '''
 
-    #
-    # add in the pagination
-    #
+    check_time = time.monotonic()
+    last_checked = _OBJECT_IMAGE_CACHE_STATE['checked']
+    check_generation = (
+        last_checked is None or
+        (check_time - last_checked) > OBJECT_IMAGE_CACHE_CHECK_SECONDS
+    )
 
-    # if only start_keyid is provided
-    if (start_keyid is not None and
-        end_keyid is None and
-        max_objects is not None):
-        paged_sel = actual_sel.where(
-            object_catalog_sample.c.id >= start_keyid
-        ).order_by(object_catalog_sample.c.id).limit(max_objects)
-        revorder = False
+    if not check_generation:
+        filepath = _OBJECT_IMAGE_FILEPATHS.get(objectid, _NOT_CACHED)
+        if filepath is not _NOT_CACHED:
+            return filepath
 
-    elif (start_keyid is not None and
-          end_keyid is None and
-          max_objects is None):
-        paged_sel = actual_sel.where(
-            object_catalog_sample.c.id >= start_keyid
-        ).order_by(object_catalog_sample.c.id)
-        revorder = False
+    with _dbconn(dbinfo, dbkwargs) as (conn, meta):
 
-    # if only end_keyid is provided
-    elif (start_keyid is None and
-          end_keyid is not None and
-          max_objects is not None):
-        paged_sel = actual_sel.where(
-            object_catalog_sample.c.id <= end_keyid
-        ).order_by(object_catalog_sample.c.id.desc()).limit(max_objects)
-        revorder = True
+        object_images = meta.tables['object_images']
 
-    elif (start_keyid is None and
-          end_keyid is not None and
-          max_objects is None):
-        paged_sel = actual_sel.where(
-            object_catalog_sample.c.id <= end_keyid
-        ).order_by(object_catalog_sample.c.id.desc())
-        revorder = True
+        with conn.begin():
 
-    # if both are provided
-    elif (start_keyid is not None and
-          end_keyid is not None):
-        paged_sel = actual_sel.where(
-            object_catalog_sample.c.id >= start_keyid
-        ).where(
-            object_catalog_sample.c.id <= end_keyid
-        ).order_by(object_catalog_sample.c.id)
-        revorder = False
+            if check_generation:
 
-    # everything else has no pagination
-    else:
-        paged_sel = actual_sel
-        revorder = False
+                res = conn.execute(
+                    select([func.max(object_images.c.imageid),
+                            func.max(object_images.c.updated)])
+                )
+                generation = tuple(res.fetchone())
+                res.close()
 
-    with conn.begin():
+                if generation != _OBJECT_IMAGE_CACHE_STATE['generation']:
+                    _OBJECT_IMAGE_FILEPATHS.clear()
+                    _OBJECT_IMAGE_CACHE_STATE['generation'] = generation
+                _OBJECT_IMAGE_CACHE_STATE['checked'] = check_time
 
-        res = conn.execute(paged_sel)
-        if fast_fetch:
-            rows = res.fetchall()
-            if len(rows) > 0:
-                if not revorder:
-                    ret_start_keyid = rows[0][0]
-                    ret_end_keyid = rows[-1][0]
-                else:
-                    ret_start_keyid = rows[-1][0]
-                    ret_end_keyid = rows[0][0]
+            filepath = _OBJECT_IMAGE_FILEPATHS.get(objectid, _NOT_CACHED)
 
-            else:
-                ret_start_keyid = 1
-                ret_end_keyid = 1
-        else:
-            rows = [
-                {column: value for column, value in row.items()} for row in res
-            ]
-            if len(rows) > 0:
-                if not revorder:
-                    ret_start_keyid = rows[0]['keyid']
-                    ret_end_keyid = rows[-1]['keyid']
-                else:
-                    ret_start_keyid = rows[-1]['keyid']
-                    ret_end_keyid = rows[0]['keyid']
+            if filepath is _NOT_CACHED:
 
-            else:
-                ret_start_keyid = 1
-                ret_end_keyid = 1
+                res = conn.execute(
+                    select([object_images.c.filepath]).where(
+                        object_images.c.objectid == objectid
+                    )
+                )
+                row = res.fetchone()
+                res.close()
 
-    # close everything down if we were passed a database URL only and had to
-    # make a new engine
-    if engine:
-        conn.close()
-        meta.bind = None
-        engine.dispose()
+                filepath = row[0] if row is not None else None
+                _OBJECT_IMAGE_FILEPATHS[objectid] = filepath
 
-    return rows, ret_start_keyid, ret_end_keyid, revorder
+    return filepath
 
 
 def get_object_count(
@@ -768,7 +1807,7 @@ def insert_object_comments(
         - the database URL or the connection instance to use
         - the database metadata object
 
-        If the database URL is provided, a new engine will be used. If the
+        If the database URL is provided, a pooled engine will be used. If the
         connection itself is provided, it will be re-used.
 
     username : str or None
@@ -785,136 +1824,101 @@ def insert_object_comments(
 
     '''
 
-    #
-    # get the database
-    #
-    dbref, dbmeta = dbinfo
-    if not dbkwargs:
-        dbkwargs = {}
-    if isinstance(dbref, str) and 'postgres' in dbref:
-        if not dbkwargs:
-            dbkwargs = {'engine_kwargs':{'json_serializer':json_dumps}}
-        elif dbkwargs and 'engine_kwargs' not in dbkwargs:
-            dbkwargs['engine_kwargs'] = {'json_serializer':json_dumps}
-        elif dbkwargs and 'engine_kwargs' in dbkwargs:
-            dbkwargs['engine_kwargs'].update({'json_serializer':json_dumps})
-        engine, conn, meta = get_postgres_db(dbref,
-                                             dbmeta,
-                                             **dbkwargs)
-    elif isinstance(dbref, str) and 'postgres' not in dbref:
-        raise NotImplementedError(
-            "viz-inspect currently doesn't support non-Postgres databases."
-        )
-    else:
-        engine, conn, meta = None, dbref, dbmeta
-        meta.bind = conn
-    #
-    # end of database get
-    #
-
-    # prepare the tables
-    object_comments = meta.tables['object_comments']
-    object_catalog = meta.tables['object_catalog']
+    objectid = comments['objectid']
+    user_flags = comments['user_flags']
 
-    with conn.begin():
+    # bleach and markdown render the comment before we touch the DB so the
+    # transaction below doesn't stay open while this runs
+    rendered_comment = _render_comment(comments['comment'])
 
-        added = updated = datetime.now(tz=utc)
-        objectid = comments['objectid']
-        comment_text = comments['comment']
-        user_flags = comments['user_flags']
+    with _dbconn(dbinfo, dbkwargs) as (conn, meta):
 
-        # 1. bleach the comment
-        cleaned_comment = bleach.clean(comment_text, strip=True)
+        # prepare the tables
+        object_comments = meta.tables['object_comments']
+        object_catalog = meta.tables['object_catalog']
 
-        # 2. markdown render the comment
-        rendered_comment = markdown.markdown(
-            cleaned_comment,
-            output_format='html5',
-        )
+        with conn.begin():
 
-        # check if this user has already commented on this object
-        sel = select([object_comments.c.userid]).select_from(
-            object_comments
-        ).where(
-            object_comments.c.objectid == objectid
-        ).where(
-            object_comments.c.userid == userid
-        )
+            added = updated = datetime.now(tz=utc)
 
-        res = conn.execute(sel)
-        checkcount = res.rowcount
-        res.close()
+            # check if this user has already commented on this object and get
+            # the object's current flag counts in the same query. the object's
+            # row stays locked until the end of the transaction, so concurrent
+            # comments on the same object can't overwrite each other's counts.
+            already_commented = exists().where(
+                object_comments.c.objectid == objectid
+            ).where(
+                object_comments.c.userid == userid
+            )
+            sel = select([
+                already_commented.label('already_commented'),
+                object_catalog.c.user_flags
+            ]).select_from(object_catalog).where(
+                object_catalog.c.objectid == objectid
+            ).with_for_update(of=object_catalog)
 
-        if checkcount > 0:
+            res = conn.execute(sel)
+            object_row = res.fetchone()
+            res.close()
 
-            LOGINFO("Userid: %s has already commented on object: %s" %
-                    (userid, objectid))
-            updated = 0
+            if object_row is not None and object_row['already_commented']:
 
-        else:
+                LOGINFO("Userid: %s has already commented on object: %s" %
+                        (userid, objectid))
+                updated = 0
 
-            # prepare the insert
-            insert = pg.insert(
-                object_comments
-            ).values(
-                {'objectid':objectid,
-                 'added':added,
-                 'updated':updated,
-                 'userid':userid,
-                 'username':username,
-                 'user_flags':user_flags,
-                 'contents':rendered_comment}
-            )
-            res = conn.execute(insert)
-            updated = res.rowcount
-            res.close()
+            else:
 
-            #
-            # now update the counts for the object_flags
-            #
-            sel = select([object_catalog.c.user_flags]).where(
-                object_catalog.c.objectid == objectid
-            ).select_from(object_catalog)
+                # prepare the insert
+                insert = pg.insert(
+                    object_comments
+                ).values(
+                    {'objectid':objectid,
+                     'added':added,
+                     'updated':updated,
+                     'userid':userid,
+                     'username':username,
+                     'user_flags':user_flags,
+                     'contents':rendered_comment}
+                )
+                res = conn.execute(insert)
+                updated = res.rowcount
+                res.close()
 
-            res = conn.execute(sel)
-            flag_counts = res.scalar()
-
-            for k in user_flags:
-                if user_flags[k] is True:
-                    flag_counts[k] = flag_counts[k] + 1
-
-            # if any of the good/bad flags make it over the limits, set the
-            # appropriate review_status
-            bad_flag_sum = sum(flag_counts[k] for k in bad_flags)
-            good_flag_sum = sum(flag_counts[k] for k in good_flags)
-            all_flag_sum = bad_flag_sum + good_flag_sum
-
-            if good_flag_sum >= max_good_votes:
-                new_review_status = 'complete-good'
-            elif bad_flag_sum >= max_bad_votes:
-                new_review_status = 'complete-bad'
-            elif (all_flag_sum < max_all_votes):
-                new_review_status = 'incomplete'
-            else:
-                new_review_status = 'incomplete'
+                #
+                # now update the counts for the object_flags
+                #
+                flag_counts = object_row['user_flags']
 
-            # update the flags and review status
-            upd = update(object_catalog).where(
-                object_catalog.c.objectid == objectid
-            ).values(
-                {'user_flags':flag_counts,
-                 'review_status':new_review_status}
-            )
+                for k in user_flags:
+                    if user_flags[k] is True:
+                        flag_counts[k] = flag_counts[k] + 1
 
-            res = conn.execute(upd)
-            res.close()
+                # if any of the good/bad flags make it over the limits, set the
+                # appropriate review_status
+                bad_flag_sum = sum(flag_counts[k] for k in bad_flags)
+                good_flag_sum = sum(flag_counts[k] for k in good_flags)
+                all_flag_sum = bad_flag_sum + good_flag_sum
+
+                if good_flag_sum >= max_good_votes:
+                    new_review_status = 'complete-good'
+                elif bad_flag_sum >= max_bad_votes:
+                    new_review_status = 'complete-bad'
+                elif (all_flag_sum < max_all_votes):
+                    new_review_status = 'incomplete'
+                else:
+                    new_review_status = 'incomplete'
+
+                # update the flags and review status
+                upd = update(object_catalog).where(
+                    object_catalog.c.objectid == objectid
+                ).values(
+                    {'user_flags':flag_counts,
+                     'review_status':new_review_status}
+                )
 
-    # close everything down if we were passed a database URL only and had to
-    # make a new engine
-    if engine:
-        conn.close()
-        meta.bind = None
-        engine.dispose()
+                res = conn.execute(upd)
+                res.close()
 
     return updated
 
@@ -935,197 +1939,168 @@ def update_vote(
         extra_comments=None,
 ):
 
-    dbref, dbmeta = dbinfo
-    if not dbkwargs:
-        dbkwargs = {}
-    if isinstance(dbref, str) and 'postgres' in dbref:
-        if not dbkwargs:
-            dbkwargs = {'engine_kwargs':{'json_serializer':json_dumps}}
-        elif dbkwargs and 'engine_kwargs' not in dbkwargs:
-            dbkwargs['engine_kwargs'] = {'json_serializer':json_dumps}
-        elif dbkwargs and 'engine_kwargs' in dbkwargs:
-            dbkwargs['engine_kwargs'].update({'json_serializer':json_dumps})
-        engine, conn, meta = get_postgres_db(dbref,
-                                             dbmeta,
-                                             **dbkwargs)
-    elif isinstance(dbref, str) and 'postgres' not in dbref:
-        raise NotImplementedError(
-            "viz-inspect currently doesn't support non-Postgres databases."
-        )
-    else:
-        engine, conn, meta = None, dbref, dbmeta
-        meta.bind = conn
-
-    object_comments = meta.tables['object_comments']
-    object_catalog = meta.tables['object_catalog']
-
-    with conn.begin():
+    with _dbconn(dbinfo, dbkwargs) as (conn, meta):
 
-        added = updated = datetime.now(tz=utc)
-
-        sel = select([object_comments.c.user_flags]).select_from(
-            object_comments
-        ).where(
-            object_comments.c.objectid == objectid
-        ).where(
-            object_comments.c.userid == userid
-        )
+        object_comments = meta.tables['object_comments']
+        object_catalog = meta.tables['object_catalog']
 
-        res = conn.execute(sel)
-        checkcount = res.rowcount
-        this_user_flags = res.scalar()
-        res.close()
+        with conn.begin():
 
-        if (checkcount > 0) and not is_admin:
-            _flag = [k for k, v in this_user_flags.items() if v]
-            if len(_flag) != 1:
-                raise Exception('Should be one vote!')
-            this_user_flags[_flag[0]] = False
-            this_user_flags[new_vote] = True
+            added = updated = datetime.now(tz=utc)
 
-            LOGINFO('Changing the vote of user {} for hugs-{} from {} to {}'.\
-                    format(userid, objectid, _flag[0], new_vote))
+            # get this user's current vote on this object and the object's
+            # current flag counts in the same query. the object's row stays
+            # locked until the end of the transaction, so concurrent votes on
+            # the same object can't overwrite each other's counts.
+            this_user_flags_sel = select([object_comments.c.user_flags]).where(
+                object_comments.c.objectid == objectid
+            ).where(
+                object_comments.c.userid == userid
+            ).limit(1).as_scalar()
 
-            sel = select([object_catalog.c.user_flags]).where(
+            sel = select([
+                this_user_flags_sel.label('this_user_flags'),
+                object_catalog.c.user_flags
+            ]).select_from(object_catalog).where(
                 object_catalog.c.objectid == objectid
-            ).select_from(object_catalog)
+            ).with_for_update(of=object_catalog)
 
             res = conn.execute(sel)
-            flag_counts = res.scalar()
-
-            # update flag counts for new vote
-            LOGINFO('Old flags: {}'.format(flag_counts))
-            flag_counts[_flag[0]] -= 1
-            flag_counts[new_vote] += 1
-            LOGINFO('New flags: {}'.format(flag_counts))
-
-            # if any of the good/bad flags make it over the limits, set the
-            # appropriate review_status
-            bad_flag_sum = sum(flag_counts[k] for k in bad_flags)
-            good_flag_sum = sum(flag_counts[k] for k in good_flags)
-            all_flag_sum = bad_flag_sum + good_flag_sum
-
-            if good_flag_sum >= max_good_votes:
-                new_review_status = 'complete-good'
-            elif bad_flag_sum >= max_bad_votes:
-                new_review_status = 'complete-bad'
-            elif (all_flag_sum < max_all_votes):
-                new_review_status = 'incomplete'
-            else:
-                new_review_status = 'incomplete'
-
-            LOGINFO('Review status is: ' + new_review_status)
-
-            # update the flags and review status
-            upd = update(object_catalog).where(
-                object_catalog.c.objectid == objectid
-            ).values(
-                {'user_flags':flag_counts,
-                 'review_status':new_review_status}
-            )
-
-            res = conn.execute(upd)
-            res.close()
-
-            upd = update(object_comments).where(
-                object_comments.c.objectid== objectid
-            ).where(
-                object_comments.c.userid == userid
-            ).values({'user_flags':this_user_flags})
-
-            res = conn.execute(upd)
+            object_row = res.fetchone()
             res.close()
 
-        else:
-
-            if not is_admin:
-                LOGINFO('Inserting vote for user {} for hugs-{}'.\
-                        format(userid, objectid))
-
-            all_flags = good_flags + bad_flags
+            if object_row is not None:
+                this_user_flags = object_row['this_user_flags']
+                flag_counts = object_row['user_flags']
+            else:
+                this_user_flags = flag_counts = None
+
+            if (this_user_flags is not None) and not is_admin:
+                _flag = [k for k, v in this_user_flags.items() if v]
+                if len(_flag) != 1:
+                    raise Exception('Should be one vote!')
+                this_user_flags[_flag[0]] = False
+                this_user_flags[new_vote] = True
+
+                LOGINFO(
+                    'Changing the vote of user {} for hugs-{} from {} to {}'.\
+                    format(userid, objectid, _flag[0], new_vote)
+                )
 
-            # 1. bleach the comment
-            _comment = 'ADMIN override'
-            if extra_comments is not None:
-                _comment = '{}, {}'.format(
-                    extra_comments.replace('"', ''), _comment)
-            cleaned_comment = bleach.clean(_comment, strip=True)
+                # update flag counts for new vote
+                LOGINFO('Old flags: {}'.format(flag_counts))
+                flag_counts[_flag[0]] -= 1
+                flag_counts[new_vote] += 1
+                LOGINFO('New flags: {}'.format(flag_counts))
+
+                # if any of the good/bad flags make it over the limits, set the
+                # appropriate review_status
+                bad_flag_sum = sum(flag_counts[k] for k in bad_flags)
+                good_flag_sum = sum(flag_counts[k] for k in good_flags)
+                all_flag_sum = bad_flag_sum + good_flag_sum
+
+                if good_flag_sum >= max_good_votes:
+                    new_review_status = 'complete-good'
+                elif bad_flag_sum >= max_bad_votes:
+                    new_review_status = 'complete-bad'
+                elif (all_flag_sum < max_all_votes):
+                    new_review_status = 'incomplete'
+                else:
+                    new_review_status = 'incomplete'
 
-            # 2. markdown render the comment
-            rendered_comment = markdown.markdown(
-                cleaned_comment,
-                output_format='html5',
-            )
+                LOGINFO('Review status is: ' + new_review_status)
 
-            user_flags = {f:False for f in all_flags}
-            user_flags[new_vote] = True
-
-            # prepare the insert
-            insert = pg.insert(
-                object_comments
-            ).values(
-                {'objectid':objectid,
-                 'added':added,
-                 'updated':updated,
-                 'userid':userid,
-                 'username':username,
-                 'user_flags':user_flags,
-                 'contents':rendered_comment}
-            )
-            res = conn.execute(insert)
-            updated = res.rowcount
-            res.close()
+                # update the flags and review status
+                upd = update(object_catalog).where(
+                    object_catalog.c.objectid == objectid
+                ).values(
+                    {'user_flags':flag_counts,
+                     'review_status':new_review_status}
+                )
 
-            #
-            # now update the counts for the object_flags
-            #
-            sel = select([object_catalog.c.user_flags]).where(
-                object_catalog.c.objectid == objectid
-            ).select_from(object_catalog)
+                res = conn.execute(upd)
+                res.close()
 
-            res = conn.execute(sel)
-            flag_counts = res.scalar()
+                upd = update(object_comments).where(
+                    object_comments.c.objectid== objectid
+                ).where(
+                    object_comments.c.userid == userid
+                ).values({'user_flags':this_user_flags})
 
-            if is_admin:
-                LOGINFO('Admin overriding final vote for {} to {}'.\
-                    format(objectid, new_vote))
-                for k in user_flags:
-                    flag_counts[k] = 0
-                flag_counts[new_vote] = 2
-            else:
-                for k in user_flags:
-                    if user_flags[k] is True:
-                        flag_counts[k] = flag_counts[k] + 1
+                res = conn.execute(upd)
+                res.close()
 
-            # if any of the good/bad flags make it over the limits, set the
-            # appropriate review_status
-            bad_flag_sum = sum(flag_counts[k] for k in bad_flags)
-            good_flag_sum = sum(flag_counts[k] for k in good_flags)
-            all_flag_sum = bad_flag_sum + good_flag_sum
-
-            if good_flag_sum >= max_good_votes:
-                new_review_status = 'complete-good'
-            elif bad_flag_sum >= max_bad_votes:
-                new_review_status = 'complete-bad'
-            elif (all_flag_sum < max_all_votes):
-                new_review_status = 'incomplete'
             else:
-                new_review_status = 'incomplete'
 
-            # update the flags and review status
-            upd = update(object_catalog).where(
-                object_catalog.c.objectid == objectid
-            ).values(
-                {'user_flags':flag_counts,
-                 'review_status':new_review_status}
-            )
-
-            res = conn.execute(upd)
-            res.close()
+                if not is_admin:
+                    LOGINFO('Inserting vote for user {} for hugs-{}'.\
+                            format(userid, objectid))
+
+                all_flags = good_flags + bad_flags
+
+                user_flags = {f:False for f in all_flags}
+                user_flags[new_vote] = True
+
+                # bleach and markdown render the comment. this is only needed
+                # when a new comment row is inserted, so changed votes skip it.
+                _comment = 'ADMIN override'
+                if extra_comments is not None:
+                    _comment = '{}, {}'.format(
+                        extra_comments.replace('"', ''), _comment)
+                rendered_comment = _render_comment(_comment)
+
+                # prepare the insert
+                insert = pg.insert(
+                    object_comments
+                ).values(
+                    {'objectid':objectid,
+                     'added':added,
+                     'updated':updated,
+                     'userid':userid,
+                     'username':username,
+                     'user_flags':user_flags,
+                     'contents':rendered_comment}
+                )
+                res = conn.execute(insert)
+                updated = res.rowcount
+                res.close()
+
+                #
+                # now update the counts for the object_flags
+                #
+                if is_admin:
+                    LOGINFO('Admin overriding final vote for {} to {}'.\
+                        format(objectid, new_vote))
+                    for k in user_flags:
+                        flag_counts[k] = 0
+                    flag_counts[new_vote] = 2
+                else:
+                    for k in user_flags:
+                        if user_flags[k] is True:
+                            flag_counts[k] = flag_counts[k] + 1
+
+                # if any of the good/bad flags make it over the limits, set the
+                # appropriate review_status
+                bad_flag_sum = sum(flag_counts[k] for k in bad_flags)
+                good_flag_sum = sum(flag_counts[k] for k in good_flags)
+                all_flag_sum = bad_flag_sum + good_flag_sum
+
+                if good_flag_sum >= max_good_votes:
+                    new_review_status = 'complete-good'
+                elif bad_flag_sum >= max_bad_votes:
+                    new_review_status = 'complete-bad'
+                elif (all_flag_sum < max_all_votes):
+                    new_review_status = 'incomplete'
+                else:
+                    new_review_status = 'incomplete'
+
+                # update the flags and review status
+                upd = update(object_catalog).where(
+                    object_catalog.c.objectid == objectid
+                ).values(
+                    {'user_flags':flag_counts,
+                     'review_status':new_review_status}
+                )
 
-    # close everything down if we were passed a database URL only and had to
-    # make a new engine
-    if engine:
-        conn.close()
-        meta.bind = None
-        engine.dispose()
+                res = conn.execute(upd)
+                res.close()
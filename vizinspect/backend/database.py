@@ -19,7 +19,8 @@ from sqlalchemy import (
     Float,
     Text,
     ForeignKey,
-    MetaData
+    MetaData,
+    Index
 )
 
 from sqlalchemy.dialects import postgresql
@@ -50,9 +51,16 @@ Catalog = Table(
     Column('user_flags', postgresql.JSONB),
     Column('reviewer_userid', Integer, index=True),
     Column('extra_columns', postgresql.JSONB),
-    Column('review_status', Text, index=True, default='incomplete'),
+    Column('review_status', Text, default='incomplete'),
 )
 
+# get_objects pages through the catalog in keyid order, usually filtered on
+# review_status, so this lets those pages be read straight off an index. it
+# also serves lookups on review_status alone.
+Index('ix_object_catalog_review_status_id',
+      Catalog.c.review_status,
+      Catalog.c.id)
+
 Catalog = Table(
     'object_images',
     VIZINSPECT,
@@ -82,7 +90,7 @@ Comments = Table(
            onupdate=datetime.utcnow(),
            default=datetime.utcnow()),
     Column('objectid', Integer, ForeignKey('object_catalog.objectid'),
-           nullable=False, index=True),
+           nullable=False),
     Column('userid', Integer, nullable=False, index=True),
     Column('username', Text, index=True),
     # this is the per-user set flags
@@ -90,6 +98,12 @@ Comments = Table(
     Column('contents', Text),
 )
 
+# this is used to look up an object's comments in newest-first order without a
+# separate sort. it also serves lookups and joins on objectid alone.
+Index('ix_object_comments_objectid_added',
+      Comments.c.objectid,
+      Comments.c.added.desc())
+
 Reviewers = Table(
     'object_reviewers',
     VIZINSPECT,
@@ -111,6 +125,14 @@ import json
 import numpy as np
 from sqlalchemy.engine.result import RowProxy
 
+# orjson is several times faster than the stdlib json module for the
+# dicts-of-floats in the JSONB columns, so we'll use it if it's available
+try:
+    import orjson
+    HAVE_ORJSON = True
+except Exception:
+    HAVE_ORJSON = False
+
 
 class DatabaseJSONEncoder(json.JSONEncoder):
 
@@ -137,12 +159,41 @@ class DatabaseJSONEncoder(json.JSONEncoder):
             return json.JSONEncoder.default(self, obj)
 
 
+_ENCODER = DatabaseJSONEncoder()
+
+
+def _orjson_default(obj):
+    '''
+    This handles the types orjson can't serialize by itself.
+
+    '''
+
+    if isinstance(obj, bytes):
+        return obj.decode()
+    elif isinstance(obj, complex):
+        return (obj.real, obj.imag)
+    elif isinstance(obj, RowProxy):
+        return tuple(obj)
+    else:
+        return _ENCODER.default(obj)
+
+
 def json_dumps(obj):
     '''
     This uses a customized JSONEncoder to be able to serialize more things.
 
+    If orjson is available, it's used instead. orjson handles numpy arrays and
+    scalars and datetimes natively, and writes NaN and inf as null.
+
     '''
 
+    if HAVE_ORJSON:
+        return orjson.dumps(
+            obj,
+            default=_orjson_default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        ).decode()
+
     dumped = json.dumps(obj, cls=DatabaseJSONEncoder)
     dumped = dumped.replace('NaN','null')
     return dumped
@@ -242,8 +293,8 @@ def get_vizinspect_db(database_url,
 
     engine_kwargs : dict or None
         This contains any kwargs to pass to the `create_engine` call. One
-        specific use-case is passing `use_batch_mode=True` to a PostgreSQL
-        engine to enable fast `executemany` statements.
+        specific use-case is passing `executemany_mode='values'` to a
+        PostgreSQL engine to enable fast `executemany` statements.
 
     echo : bool
         If True, will echo the DDL lines used for creation of the database.
@@ -312,8 +363,8 @@ def get_postgres_db(database_url,
 
     engine_kwargs : dict or None
         This contains any kwargs to pass to the `create_engine` call. One
-        specific use-case is passing `use_batch_mode=True` to a PostgreSQL
-        engine to enable fast `executemany` statements.
+        specific use-case is passing `executemany_mode='values'` to a
+        PostgreSQL engine to enable fast `executemany` statements.
 
     echo : bool
         If True, will echo the DDL lines used for creation of the database.
@@ -327,10 +378,18 @@ def get_postgres_db(database_url,
 
     '''
 
+    # psycopg2's plain executemany is a loop of single-row statements. The
+    # 'values' mode sends INSERTs as multi-row VALUES lists via
+    # psycopg2.extras.execute_values and everything else through
+    # execute_batch. (SQLAlchemy 1.4 renames this mode 'values_plus_batch'.)
+    batch_kwargs = {'executemany_mode':'values',
+                    'executemany_values_page_size':10000,
+                    'executemany_batch_page_size':500}
+
     if engine_kwargs is None:
-        engine_kwargs = {'use_batch_mode':True}
+        engine_kwargs = batch_kwargs
     elif isinstance(engine_kwargs, dict):
-        engine_kwargs.update({'use_batch_mode':True})
+        engine_kwargs.update(batch_kwargs)
 
     return get_vizinspect_db(database_url,
                              database_metadata,
@@ -52,7 +52,7 @@ import matplotlib.image as mpimg
 import matplotlib.pyplot as plt
 
 from vizinspect import bucketstorage
-from .catalogs import get_object, get_objects
+from .catalogs import get_object, get_objects, get_object_image_filepath
 
 
 
@@ -175,7 +175,7 @@ def make_main_plot(
         - the database URL or the connection instance to use
         - the database metadata object
 
-        If the database URL is provided, a new engine will be used. If the
+        If the database URL is provided, a pooled engine will be used. If the
         connection itself is provided, it will be re-used.
 
     outdir : str
@@ -238,7 +238,7 @@ def make_main_plot(
     this_mu_e_ave_forced_g = (
         this_object[0]['extra_columns']['mu_ave_g']
     )
-    this_object_image = this_object[0]['filepath']
+    this_object_image = get_object_image_filepath(objectid, dbinfo)
 
     plot_fontsize = 15
     fig = plt.figure(figsize=(10, 6))
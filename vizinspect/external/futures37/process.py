@@ -667,9 +667,16 @@ class ProcessPoolExecutor(_base.Executor):
                               timeout=timeout)
         return _chain_from_iterable_of_lists(results)
 
-    def shutdown(self, wait=True):
+    def shutdown(self, wait=True, *, cancel_futures=False):
         with self._shutdown_lock:
             self._shutdown_thread = True
+            if cancel_futures:
+                # backport of the Python 3.9 cancel_futures option: work items
+                # not yet handed to a worker are still PENDING and can be
+                # cancelled. the queue management thread drops them when it
+                # tries to move them to the call queue.
+                for work_item in list(self._pending_work_items.values()):
+                    work_item.future.cancel()
         if self._queue_management_thread:
             # Wake up queue management thread
             self._queue_management_thread_wakeup.wakeup()
@@ -19,7 +19,6 @@ import logging
 import os
 import os.path
 import signal
-import time
 import sys
 import socket
 import json
@@ -1102,8 +1101,7 @@ def main():
         loop.stop()
         # close down the processpool
 
-    EXECUTOR.shutdown()
-    time.sleep(2)
+    EXECUTOR.shutdown(wait=True, cancel_futures=True)
 
 
 # run the server